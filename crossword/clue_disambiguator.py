@@ -1,39 +1,178 @@
 # Uses word sense disambiguation to label each word in each hint
 # 
 
+import os
 import nltk
-from word_sense_disambiguation import *
 import pickle
+import tempfile
+import multiprocessing
+from word_sense_disambiguation import *
 from nltk.stem import *
 from nltk.stem.porter import *
 from location_globals import *
+from clue_store import ClueStore, store_fingerprint
+from clue_stemmer import make_stem_cache
+from wordnet_signatures import *
 
 cache = {}
 
-def fill_cache(data):
+def disambiguate_lesk(clue_item, normalize=None):
+	# synset name of each token of a tagged clue, querying WordNet through
+	# lesk; None for the tokens whose tag WordNet does not cover
 
-	for clue_item in data:
-		new_sentence = []
-		sentence = [clue for (clue, pos) in clue_item]
-		parts_of_speech = [pos for (clue, pos) in clue_item]
-		
-		for i in range(len(sentence)):
-			synset = lesk(sentence, sentence[i], parts_of_speech[i])
-			print synset
-			new_sentence.append(synset)
+	sentence = [clue for (clue, pos) in clue_item]
+	new_sentence = []
+	for (word, pos) in clue_item:
+		wn_pos = penn_to_wordnet(pos)
+		synset = None
+		if wn_pos is not None:
+			synset = lesk(sentence, word, wn_pos, normalize=normalize)
+		new_sentence.append(synset.name() if synset is not None else None)
+	return new_sentence
 
-		cache[tuple(new_sentence)] = data[clue_item]
+def fill_cache(data, normalize=None, signatures=None):
+	# data is an iterable of (clue, answer) pairs, such as a ClueStore;
+	# normalize maps WordNet definition tokens to the form of the clue
+	# tokens (the clues are stemmed, so a memoized stemmer); signatures is
+	# an optional SignatureIndex, which replaces the WordNet queries by
+	# set intersections
 
+	for clue_item, answer in data:
+		if signatures is not None:
+			new_sentence = signatures.disambiguate(clue_item)
+		else:
+			new_sentence = disambiguate_lesk(clue_item, normalize)
 
-def main():
-	f = open(STEMMED_CLUE_FILE, 'rb')
-	current_data = pickle.load(f)
+		cache[tuple(new_sentence)] = answer
+
+def load_signatures(normalize, store_base=STEMMED_CLUE_STORE):
+	# the signature index of the stemmed clues, built and saved on the
+	# first run, and rebuilt when the saved one is of another store or of
+	# an older version of this one
+
+	source = store_fingerprint(store_base)
+	if os.path.exists(SIGNATURE_INDEX_FILE):
+		signatures = load_signature_index(SIGNATURE_INDEX_FILE, normalize)
+		if signatures.source == source:
+			return signatures
+	signatures = SignatureIndex(normalize, source)
+	signatures.add_clues(ClueStore(store_base))
+	signatures.save(SIGNATURE_INDEX_FILE)
+	return signatures
+
+####################################################
+######## Sharded, resumable cache building #########
+####################################################
+
+def shard_filename(checkpoint_dir, shard):
+	return os.path.join(checkpoint_dir, 'shard_{0:05d}.data'.format(shard))
+
+def save_atomic(obj, filename):
+	# pickle to a temporary file, then rename it, so a crash never leaves
+	# a partial file under the final name
+
+	fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(filename) or '.', \
+		suffix='.tmp')
+	f = os.fdopen(fd, 'wb')
+	pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+	f.close()
+	os.rename(temp_file, filename)
+
+disambiguation_worker = {}
+
+def init_disambiguation_worker(store_base, checkpoint_dir):
+	# runs once in each worker process: open the clue store (memory-mapped)
+	# and load the stem cache and signature index
+
+	stem = make_stem_cache()
+	disambiguation_worker['store'] = ClueStore(store_base)
+	disambiguation_worker['signatures'] = load_signature_index( \
+		SIGNATURE_INDEX_FILE, stem)
+	disambiguation_worker['checkpoint_dir'] = checkpoint_dir
+
+def disambiguate_shard(shard_range):
+	# disambiguates the records start to end - 1 of the store, and
+	# checkpoints the (synset tuple, answer) pairs of the shard to disk
+
+	shard, start, end = shard_range
+	store = disambiguation_worker['store']
+	signatures = disambiguation_worker['signatures']
+	senses = []
+	for i in range(start, end):
+		clue_item, answer = store[i]
+		senses.append((tuple(signatures.disambiguate(clue_item)), answer))
+	save_atomic(senses, shard_filename( \
+		disambiguation_worker['checkpoint_dir'], shard))
+	return shard
+
+def build_sense_index(store_base, checkpoint_dir, index_filename, \
+	jobs=None, shard_size=5000, verbose=False):
+	# Disambiguates every clue of the store across a process pool, one shard
+	# of records at a time. Each finished shard is checkpointed in
+	# checkpoint_dir, and a restart skips the shards already there. Then the
+	# shards are merged in order (later clues win, as in fill_cache) into
+	# the synset tuple -> answer index, saved to index_filename
+
+	if not os.path.isdir(checkpoint_dir):
+		os.makedirs(checkpoint_dir)
+	num_records = len(ClueStore(store_base))
+	# the shards are only valid for the same store contents and shard size
+	manifest = (store_fingerprint(store_base), shard_size)
+	manifest_file = os.path.join(checkpoint_dir, 'manifest.data')
+	if os.path.exists(manifest_file):
+		f = open(manifest_file, 'rb')
+		saved_manifest = pickle.load(f)
+		f.close()
+		if saved_manifest != manifest:
+			raise ValueError('Checkpoints in ' + checkpoint_dir + ' are for ' \
+				'a different store or shard size; remove them to start over')
+	else:
+		save_atomic(manifest, manifest_file)
+	shards = [(shard, start, min(start + shard_size, num_records)) \
+		for shard, start in enumerate(range(0, num_records, shard_size))]
+	pending = [shard_range for shard_range in shards if not \
+		os.path.exists(shard_filename(checkpoint_dir, shard_range[0]))]
+	if verbose:
+		print len(shards) - len(pending), "of", len(shards), \
+			"shards already done"
+
+	if len(pending) > 0:
+		# the workers load the signature index from disk, so make sure it
+		# exists first
+		load_signatures(make_stem_cache(), store_base)
+		if jobs is None:
+			jobs = multiprocessing.cpu_count()
+		pool = multiprocessing.Pool(jobs, init_disambiguation_worker, \
+			(store_base, checkpoint_dir))
+		try:
+			for done, shard in enumerate(pool.imap_unordered( \
+				disambiguate_shard, pending)):
+				if verbose:
+					print "Finished shard", shard, "({0} of {1})".format( \
+						done + 1, len(pending))
+		finally:
+			pool.terminate()
+			pool.join()
+
+	sense_index = {}
+	for (shard, start, end) in shards:
+		f = open(shard_filename(checkpoint_dir, shard), 'rb')
+		sense_index.update(pickle.load(f))
+		f.close()
+	save_atomic(sense_index, index_filename)
+	return sense_index
+
+def load_sense_index(index_filename=SENSE_INDEX_FILE):
+	f = open(index_filename, 'rb')
+	sense_index = pickle.load(f)
 	f.close()
+	return sense_index
 
-	fill_cache(current_data)
-	print cache
-	
-	
+
+def main():
+	sense_index = build_sense_index(STEMMED_CLUE_STORE, \
+		DISAMBIGUATION_CHECKPOINT_DIR, SENSE_INDEX_FILE, verbose=True)
+	print "Indexed", len(sense_index), "synset tuples"
 
 
 if __name__ == '__main__':
@@ -1,42 +1,107 @@
-
 """
 Used for processing tagged clue data and reducing using Porter Stemming
 """
 
 import nltk
-import pickle
+import itertools
+import multiprocessing
 from nltk.stem import *
 from nltk.stem.porter import *
 from location_globals import *
+from clue_store import ClueStore
+from clue_tagger import iter_batches
+from token_cache import TokenCache
+
+def make_stem_cache(cache_file=STEM_CACHE_FILE, capacity=100000):
+	# memoized Porter stemmer, preloaded from cache_file unless it is None
+
+	cache = TokenCache(PorterStemmer().stem, capacity)
+	if cache_file is not None:
+		cache.load(cache_file)
+	return cache
+
+def stem_clue(key, stem, verbose=False):
+	new_key = []
+	for (word, pos) in key:
+		new_word = stem(word)
+
+		if verbose: print word, "-->", new_word
+
+		new_key.append((new_word, pos))
+	return tuple(new_key)
+
+def porter_stem(tagged_store, verbose=False, stem=None):
+	# stream (stemmed clue, answer) pairs from the clue store tagged_store
+
+	if stem is None:
+		stem = make_stem_cache(None)
+
+	for key, answer in ClueStore(tagged_store):
+		yield stem_clue(key, stem, verbose), answer
+
+stem_worker = {}
+
+def init_stem_worker(cache_file):
+	stem_worker['cache'] = make_stem_cache(cache_file)
+
+def stem_batch(batch):
+	# stem a list of (clue, answer) pairs with the worker's cache; also
+	# return its hit and miss counts and the stems it had to compute, so the
+	# parent can merge them into the persisted cache
 
-def porter_stem(tagged_filename, verbose=False):
-	f = open(tagged_filename, 'rb')
-	tagged_data = pickle.load(f)
-	f.close()
+	cache = stem_worker['cache']
+	hits, misses = cache.hits, cache.misses
+	learned = {}
 
-	stemmer = PorterStemmer()
+	def stem(word):
+		if word not in cache:
+			learned[word] = cache(word)
+			return learned[word]
+		return cache(word)
 
-	new_data = {}
-	for key in tagged_data:
-		key_as_list = list(key)
-		
-		new_key = []
-		for (word, pos) in key_as_list:
-			new_word = stemmer.stem(word)
+	stemmed = [(stem_clue(key, stem), answer) for (key, answer) in batch]
+	return stemmed, cache.hits - hits, cache.misses - misses, \
+		learned.items()
 
-			if verbose: print word, "-->", new_word
-			
-			new_key.append((new_word, pos))
-		new_data[tuple(new_key)] = tagged_data[key]
+def process_tagged_to_stemmed(in_store, out_store, verbose=False, \
+	jobs=None, batch_size=1000, cache_file=STEM_CACHE_FILE):
+	# Stems the clue store in_store into out_store across a process pool, a
+	# window of batches at a time, then saves the merged stem cache
 
-	return new_data
+	if jobs is None:
+		jobs = multiprocessing.cpu_count()
+	cache = make_stem_cache(cache_file)
+	pool = multiprocessing.Pool(jobs, init_stem_worker, (cache_file,))
+	window_size = 4 * jobs
+	batches = iter_batches(ClueStore(in_store), batch_size)
+	store = ClueStore(out_store, 'w')
+	try:
+		while True:
+			window = list(itertools.islice(batches, window_size))
+			if len(window) == 0:
+				break
+			for stemmed, hits, misses, learned in pool.map(stem_batch, \
+				window, chunksize=1):
+				store.extend(stemmed)
+				cache.hits += hits
+				cache.misses += misses
+				for word, new_word in learned:
+					cache.add(word, new_word)
+			store.flush()
+			if verbose:
+				print "Stemmed", len(store), "Clues:", cache.report()
+	finally:
+		store.close()
+		pool.terminate()
+		pool.join()
+	if cache_file is not None:
+		cache.save(cache_file)
+	return cache
 
 
 def main():
-	stemmed_data = porter_stem(TAGGED_CLUE_FILE, False)
-	f = open(STEMMED_CLUE_FILE, 'wb')
-	pickle.dump(stemmed_data, f)
-	f.close()
+	cache = process_tagged_to_stemmed(TAGGED_CLUE_STORE, STEMMED_CLUE_STORE)
+	print "Stem cache:", cache.report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,320 @@
+"""
+Record-oriented on-disk store of (clue, answer) pairs, used to pass the
+clues between the stages of the pipeline (tagged, stemmed, ...) without
+loading the whole corpus
+
+A store named base is made of four files:
+	base.rec		the records, each a pickled (clue, answer) pair, one
+					after another
+	base.off		start offset of each record in base.rec (uint64s), so
+					record i is read straight from a memory map of base.rec
+	base.ans		answer index: one "answer<TAB>record id" line per record
+	base.tok		token index: one "token<TAB>record id" line per distinct
+					token of each record (the word, for (word, pos) tokens)
+Every file is only ever appended to, so a store can grow a chunk at a time
+
+Closing a store after writing compacts each of the two index logs into
+	base.ans.idx	one "key<TAB>record ids" line per distinct key, sorted by
+					key (record ids in increasing order, space separated)
+	base.ans.pos	size of the log compacted (uint64), then the start offset
+					of each line of base.ans.idx (uint64s)
+(and likewise base.tok.idx and base.tok.pos), so a lookup binary searches
+the memory-mapped lines instead of loading the whole log
+"""
+
+import os
+import mmap
+import heapq
+import struct
+import pickle
+import tempfile
+import itertools
+
+# Number of log lines sorted in memory at a time when compacting an index
+SORT_CHUNK_SIZE = 1000000
+
+class ClueStore:
+	"""
+	Class to support appending clues and reading them back by record id,
+	by answer or by token
+	"""
+	def __init__(self, base, mode='r'):
+		"""
+		base			path of the store, without extension
+		mode			'r' to read an existing store, 'a' to append to a
+						store (created if missing), 'w' to start a new one
+		"""
+		assert (mode in ['r', 'a', 'w'])
+		self.base = base
+		self.mode = mode
+		if mode != 'r':
+			file_mode = 'wb' if mode == 'w' else 'ab'
+			if mode == 'w':
+				# drop the compacted indexes of the old contents
+				for extension in ['.ans.idx', '.ans.pos', '.tok.idx', \
+					'.tok.pos']:
+					if os.path.exists(base + extension):
+						os.remove(base + extension)
+			self.rec_file = open(base + '.rec', file_mode)
+			self.off_file = open(base + '.off', file_mode)
+			self.ans_file = open(base + '.ans', file_mode)
+			self.tok_file = open(base + '.tok', file_mode)
+		# the offsets already on disk are read from a memory map; only
+		# those of the records appended since are kept in a list
+		self.offset_data = map_file(base + '.off')
+		self.num_mapped = len(self.offset_data) / 8 \
+			if self.offset_data is not None else 0
+		self.new_offsets = []
+		self.end = os.path.getsize(base + '.rec')
+		self.data = None
+		self.answer_index = None
+		self.token_index = None
+		self.sorted_indexes = {}
+
+	def __len__(self):
+		return self.num_mapped + len(self.new_offsets)
+
+	def offset(self, i):
+		""" Start offset of record [i] in the records file
+		"""
+		if i < self.num_mapped:
+			return struct.unpack_from('<Q', self.offset_data, 8 * i)[0]
+		return self.new_offsets[i - self.num_mapped]
+
+	def mapped(self, end):
+		""" Returns a memory map of the records file covering [end] bytes,
+		remapping it when appends have grown the file
+		"""
+		if self.data is None or len(self.data) < end:
+			if self.mode != 'r':
+				self.rec_file.flush()
+			if self.data is not None:
+				self.data.close()
+			f = open(self.base + '.rec', 'rb')
+			self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			f.close()
+		return self.data
+
+	def __getitem__(self, i):
+		""" Returns the (clue, answer) pair of record [i]
+		"""
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError('Record id out of range')
+		start = self.offset(i)
+		end = self.offset(i + 1) if i + 1 < len(self) else self.end
+		return pickle.loads(self.mapped(end)[start:end])
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def append(self, clue, answer):
+		""" Adds a record and returns its id
+		"""
+		assert (self.mode != 'r')
+		record_id = len(self)
+		data = pickle.dumps((clue, answer), pickle.HIGHEST_PROTOCOL)
+		self.rec_file.write(data)
+		self.off_file.write(struct.pack('<Q', self.end))
+		self.new_offsets.append(self.end)
+		self.end += len(data)
+		self.ans_file.write('{0}\t{1}\n'.format(answer, record_id))
+		if self.answer_index is not None:
+			self.answer_index.setdefault(answer, []).append(record_id)
+		for token in set(token_word(token) for token in clue):
+			self.tok_file.write('{0}\t{1}\n'.format(token, record_id))
+			if self.token_index is not None:
+				self.token_index.setdefault(token, []).append(record_id)
+		return record_id
+
+	def extend(self, items):
+		""" Appends every (clue, answer) pair of [items]
+		"""
+		for clue, answer in items:
+			self.append(clue, answer)
+
+	def flush(self):
+		if self.mode != 'r':
+			for f in [self.rec_file, self.off_file, self.ans_file, \
+				self.tok_file]:
+				f.flush()
+
+	def close(self):
+		""" Closes the files, first compacting the index logs of a store
+		opened for writing (see the module docstring)
+		"""
+		if self.mode != 'r':
+			for f in [self.rec_file, self.off_file, self.ans_file, \
+				self.tok_file]:
+				f.close()
+			compact_index(self.base + '.ans')
+			compact_index(self.base + '.tok')
+			self.mode = 'r'
+		for data in [self.data, self.offset_data] + \
+			[idx for (idx, pos) in self.sorted_indexes.values()]:
+			if data is not None:
+				data.close()
+		self.data = None
+		self.offset_data = None
+		self.sorted_indexes = {}
+
+	def sorted_index(self, extension):
+		""" Returns memory maps of the compacted index [extension] (the
+		.idx lines and the .pos offsets), or None when it is missing or
+		older than the log, or the store is open for writing
+		"""
+		if self.mode != 'r':
+			return None
+		if extension not in self.sorted_indexes:
+			log = self.base + extension
+			pos = map_file(log + '.pos')
+			if pos is None or struct.unpack_from('<Q', pos, 0)[0] != \
+				os.path.getsize(log):
+				self.sorted_indexes[extension] = None
+			else:
+				self.sorted_indexes[extension] = (map_file(log + '.idx'), pos)
+		return self.sorted_indexes[extension]
+
+	def lookup(self, extension, key):
+		""" Lists the record ids of [key] in the compacted index [extension]
+		by binary search over its sorted lines
+		"""
+		idx, pos = self.sorted_index(extension)
+		num_lines = len(pos) / 8 - 1
+		lo, hi = 0, num_lines
+		while lo < hi:
+			mid = (lo + hi) / 2
+			line_key, record_ids = index_line(idx, pos, mid, num_lines)
+			if line_key < key:
+				lo = mid + 1
+			elif line_key > key:
+				hi = mid
+			else:
+				return [int(record_id) for record_id in record_ids.split()]
+		return []
+
+	def load_index(self, extension):
+		""" Reads an index log into a dictionary from key to record ids
+		"""
+		self.flush()
+		index = {}
+		f = open(self.base + extension, 'rb')
+		for line in f:
+			key, record_id = line.rstrip('\n').rsplit('\t', 1)
+			index.setdefault(key, []).append(int(record_id))
+		f.close()
+		return index
+
+	def by_answer(self, answer):
+		""" Lists the ids of the records with [answer]
+		"""
+		if self.answer_index is None:
+			if self.sorted_index('.ans') is not None:
+				return self.lookup('.ans', answer)
+			self.answer_index = self.load_index('.ans')
+		return self.answer_index.get(answer, [])
+
+	def by_token(self, token):
+		""" Lists the ids of the records whose clue contains [token]
+		"""
+		if self.token_index is None:
+			if self.sorted_index('.tok') is not None:
+				return self.lookup('.tok', token_word(token))
+			self.token_index = self.load_index('.tok')
+		return self.token_index.get(token_word(token), [])
+
+	def clues_for(self, answer):
+		""" Lists the (clue, answer) pairs with [answer]
+		"""
+		return [self[i] for i in self.by_answer(answer)]
+
+def map_file(filename):
+	""" Returns a read-only memory map of [filename], or None if it is
+	missing or empty (which cannot be mapped)
+	"""
+	if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+		return None
+	f = open(filename, 'rb')
+	data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	f.close()
+	return data
+
+def index_line(idx, pos, i, num_lines):
+	""" Returns the (key, record ids) strings of line [i] of a compacted
+	index
+	"""
+	start = struct.unpack_from('<Q', pos, 8 * (i + 1))[0]
+	end = struct.unpack_from('<Q', pos, 8 * (i + 2))[0] \
+		if i + 1 < num_lines else len(idx)
+	return tuple(idx[start:end].rstrip('\n').rsplit('\t', 1))
+
+def read_log_pairs(f):
+	# (key, record id) pairs of the "key<TAB>record id" lines of a file
+
+	for line in f:
+		key, record_id = line.rstrip('\n').rsplit('\t', 1)
+		yield key, int(record_id)
+
+def compact_index(log):
+	""" Writes the sorted log.idx and log.pos files of the index log [log]
+	(see the module docstring), sorting SORT_CHUNK_SIZE lines at a time in
+	memory and merging the sorted chunks from temporary files
+	"""
+	log_size = os.path.getsize(log)
+	directory = os.path.dirname(log) or '.'
+	chunk_files = []
+	f = open(log, 'rb')
+	try:
+		while True:
+			chunk = sorted(read_log_pairs(itertools.islice(f, \
+				SORT_CHUNK_SIZE)))
+			if len(chunk) == 0:
+				break
+			chunk_file = tempfile.TemporaryFile(dir=directory)
+			for key, record_id in chunk:
+				chunk_file.write('{0}\t{1}\n'.format(key, record_id))
+			chunk_file.seek(0)
+			chunk_files.append(chunk_file)
+		pairs = heapq.merge(*[read_log_pairs(chunk_file) for chunk_file \
+			in chunk_files])
+		fd, idx_temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+		idx_file = os.fdopen(fd, 'wb')
+		fd, pos_temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+		pos_file = os.fdopen(fd, 'wb')
+		pos_file.write(struct.pack('<Q', log_size))
+		for key, key_pairs in itertools.groupby(pairs, lambda pair: pair[0]):
+			pos_file.write(struct.pack('<Q', idx_file.tell()))
+			idx_file.write('{0}\t{1}\n'.format(key, ' '.join(str(record_id) \
+				for (_, record_id) in key_pairs)))
+		idx_file.close()
+		pos_file.close()
+	finally:
+		f.close()
+		for chunk_file in chunk_files:
+			chunk_file.close()
+	# the .pos file records the log size, so remove the old one first and
+	# rename the new one last: a crash in between leaves it missing, and
+	# lookups fall back to the log
+	if os.path.exists(log + '.pos'):
+		os.remove(log + '.pos')
+	os.rename(idx_temp, log + '.idx')
+	os.rename(pos_temp, log + '.pos')
+
+def store_fingerprint(base):
+	""" Identifies the contents of the store [base]: its path, and the size
+	and modification time of its records and offsets files, which change
+	whenever the store is rewritten or appended to
+	"""
+	fingerprint = [os.path.abspath(base)]
+	for extension in ['.rec', '.off']:
+		stat = os.stat(base + extension)
+		fingerprint.extend([stat.st_size, stat.st_mtime])
+	return tuple(fingerprint)
+
+def token_word(token):
+	""" The indexed word of a token, which is either a word or a (word, pos)
+	pair
+	"""
+	return token[0] if isinstance(token, tuple) else token
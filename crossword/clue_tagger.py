@@ -4,8 +4,10 @@ Used for processing raw clue data into tagged clue data
 """
 
 import nltk
-import pickle
+import itertools
+import multiprocessing
 from location_globals import *
+from clue_store import ClueStore
 
 # Potential Issue: 	- clues with _ or - as in "Turn-___ (thrills)"
 #					- clues with parentheses or Abbr.
@@ -16,20 +18,20 @@ from location_globals import *
 ############ Processing Raw --> Tagged #############
 ####################################################
 
-def process_nyt_clues_text(filename):
-	# return dictionary from tuple of tokenized clues to result 
+def iter_nyt_clues(filename):
+	# stream (tuple of tokenized clue, answer) pairs, reading lazily
 
 	f = open(filename, 'rU') # universal newline support
-	lines = f.readlines()
-	f.close()
-	clue_data = {}	
-
-	for line in lines:
+	for line in f:
 		line_data = line.split()
 		line_data = line_data[:-2] # remove temporal data
-		clue_data[tuple(line_data[:-1])] = line_data[-1]
+		yield tuple(line_data[:-1]), line_data[-1]
+	f.close()
 
-	return clue_data
+def process_nyt_clues_text(filename):
+	# return dictionary from tuple of tokenized clues to result 
+
+	return dict(iter_nyt_clues(filename))
 
 def tagging_pos(clue_data, verbose = False):
 	result = {}
@@ -45,15 +47,53 @@ def tagging_pos(clue_data, verbose = False):
 
 	return result
 
-def process_nyt_to_tagged(in_filename, out_filename, verbose = False):
-	clue_data = process_nyt_clues_text(in_filename)
-	tagged_data = tagging_pos(clue_data, verbose)
-	f = open(out_filename, 'wb')
-	pickle.dump(tagged_data, f)
-	f.close()
+def tag_batch(batch):
+	# tag a list of (clue, answer) pairs with one pos_tag_sents call
+
+	tagged = nltk.pos_tag_sents([list(clue) for (clue, answer) in batch])
+	return [(tuple(clue_tagged), answer) for (clue_tagged, (clue, answer)) \
+		in zip(tagged, batch)]
+
+def iter_batches(items, batch_size):
+	items = iter(items)
+	while True:
+		batch = list(itertools.islice(items, batch_size))
+		if len(batch) == 0:
+			return
+		yield batch
+
+def process_nyt_to_tagged(in_filename, out_store, verbose = False, \
+	jobs = None, batch_size = 500):
+	# Streams the raw clues through a pool of taggers, a window of batches
+	# at a time (Pool.imap would read ahead without bound), and appends the
+	# tagged clues of each window to the clue store out_store, so memory
+	# stays bounded by the window
+
+	if jobs is None:
+		jobs = multiprocessing.cpu_count()
+	pool = multiprocessing.Pool(jobs)
+	window_size = 4 * jobs
+	batches = iter_batches(iter_nyt_clues(in_filename), batch_size)
+	store = ClueStore(out_store, 'w')
+	counter = 0
+	try:
+		while True:
+			window = list(itertools.islice(batches, window_size))
+			if len(window) == 0:
+				break
+			for tagged_batch in pool.map(tag_batch, window, chunksize=1):
+				store.extend(tagged_batch)
+				counter += len(tagged_batch)
+			store.flush()
+			if verbose:
+				print "Processed", counter, "Clues"
+	finally:
+		store.close()
+		pool.terminate()
+		pool.join()
 
 def main():
-	process_nyt_to_tagged(RAW_CLUE_FILE, TAGGED_CLUE_FILE, True)
+	process_nyt_to_tagged(RAW_CLUE_FILE, TAGGED_CLUE_STORE, True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,51 @@
+"""
+Benchmark of the clue disambiguator: clues per second when every word is
+disambiguated by querying WordNet through lesk, against set intersections
+with a precomputed signature index
+"""
+
+import time
+import argparse
+import itertools
+from location_globals import *
+from clue_store import ClueStore
+from clue_stemmer import make_stem_cache
+from clue_disambiguator import disambiguate_lesk
+from wordnet_signatures import SignatureIndex
+
+def main():
+	parser = argparse.ArgumentParser(description='Measures the clue ' \
+		'disambiguator throughput with and without the signature index')
+	parser.add_argument('-n', '--num-clues', type=int, default=2000, \
+		help='Number of clues of the store to disambiguate')
+	parser.add_argument('-s', '--store', default=STEMMED_CLUE_STORE, \
+		help='Clue store of stemmed clues')
+	args = parser.parse_args()
+	clues = [clue_item for (clue_item, answer) in itertools.islice( \
+		ClueStore(args.store), args.num_clues)]
+	stem = make_stem_cache()
+
+	start = time.time()
+	lesk_senses = [disambiguate_lesk(clue_item, stem) for clue_item in clues]
+	lesk_time = time.time() - start
+
+	start = time.time()
+	signatures = SignatureIndex(stem)
+	signatures.add_clues((clue_item, None) for clue_item in clues)
+	build_time = time.time() - start
+	start = time.time()
+	index_senses = [signatures.disambiguate(clue_item) for clue_item in clues]
+	index_time = time.time() - start
+
+	print 'path\tclues\tseconds\tclues/sec'
+	print 'lesk\t{0}\t{1:.2f}\t{2:.0f}'.format(len(clues), lesk_time, \
+		len(clues) / max(lesk_time, 1e-9))
+	print 'index\t{0}\t{1:.2f}\t{2:.0f}'.format(len(clues), index_time, \
+		len(clues) / max(index_time, 1e-9))
+	print 'Index built in {0:.2f} s for {1} (word, pos) pairs; same ' \
+		'senses for {2} of {3} clues'.format(build_time, \
+		len(signatures.signatures), sum(1 for (a, b) in zip(lesk_senses, \
+		index_senses) if a == b), len(clues))
+
+if __name__ == '__main__':
+	main()
@@ -1,5 +1,18 @@
 # Global location vars
 
 RAW_CLUE_FILE = 'clue_answer_data/nyt_clues.txt'
-TAGGED_CLUE_FILE = 'clue_answer_data/nyt_tagged.data'
-STEMMED_CLUE_FILE = 'clue_answer_data/nyt_tagged_stemmed.data'
\ No newline at end of file
+
+# Clue stores (see clue_store.py), named without their file extensions
+TAGGED_CLUE_STORE = 'clue_answer_data/nyt_tagged'
+STEMMED_CLUE_STORE = 'clue_answer_data/nyt_tagged_stemmed'
+
+# Memoized token stems shared by the pipeline stages (see token_cache.py)
+STEM_CACHE_FILE = 'clue_answer_data/stem_cache.data'
+
+# WordNet signatures of the clue vocabulary (see wordnet_signatures.py)
+SIGNATURE_INDEX_FILE = 'clue_answer_data/wordnet_signatures.data'
+
+# Checkpointed shards and result of the clue disambiguation (see
+# clue_disambiguator.py)
+DISAMBIGUATION_CHECKPOINT_DIR = 'clue_answer_data/disambiguation'
+SENSE_INDEX_FILE = 'clue_answer_data/sense_index.data'
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Bounded memo cache for per-token functions (stemming, normalization), shared
+by the stages of the clue pipeline. Clue vocabulary is very repetitive, so
+most tokens are looked up many times
+"""
+
+import os
+import pickle
+from collections import OrderedDict
+
+class TokenCache:
+	"""
+	Least-recently-used cache of the results of [func] on tokens, with hit
+	and miss counters
+	"""
+	def __init__(self, func, capacity=100000):
+		"""
+		func			function of one token to memoize
+		capacity		maximum number of tokens kept; None for no bound
+		"""
+		self.func = func
+		self.capacity = capacity
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def __call__(self, token):
+		entries = self.entries
+		if token in entries:
+			self.hits += 1
+			value = entries.pop(token)
+			entries[token] = value # most recently used last
+			return value
+		self.misses += 1
+		value = self.func(token)
+		self.add(token, value)
+		return value
+
+	def add(self, token, value):
+		""" Stores a result computed elsewhere (e.g. in a worker process)
+		"""
+		self.entries.pop(token, None)
+		self.entries[token] = value
+		if self.capacity is not None and len(self.entries) > self.capacity:
+			self.entries.popitem(last=False)
+
+	def __contains__(self, token):
+		return token in self.entries
+
+	def __len__(self):
+		return len(self.entries)
+
+	def hit_rate(self):
+		lookups = self.hits + self.misses
+		return float(self.hits) / lookups if lookups > 0 else 0.0
+
+	def report(self):
+		return '{0} lookups, {1:.1%} hit rate, {2} tokens cached'.format( \
+			self.hits + self.misses, self.hit_rate(), len(self.entries))
+
+	def save(self, filename):
+		f = open(filename, 'wb')
+		pickle.dump(self.entries.items(), f, pickle.HIGHEST_PROTOCOL)
+		f.close()
+
+	def load(self, filename):
+		""" Adds the entries saved in [filename], if it exists, keeping their
+		order of use
+		"""
+		if not os.path.exists(filename):
+			return
+		f = open(filename, 'rb')
+		for token, value in pickle.load(f):
+			self.add(token, value)
+		f.close()
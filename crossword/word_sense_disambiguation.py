@@ -9,7 +9,8 @@
 from nltk.corpus import wordnet
 
 
-def lesk(context_sentence, ambiguous_word, pos=None, synsets=None):
+def lesk(context_sentence, ambiguous_word, pos=None, synsets=None,
+         normalize=None):
     """Return a synset for an ambiguous word in a context.
 
     :param iter context_sentence: The context sentence where the ambiguous word
@@ -17,6 +18,8 @@ def lesk(context_sentence, ambiguous_word, pos=None, synsets=None):
     :param str ambiguous_word: The ambiguous word that requires WSD.
     :param str pos: A specified Part-of-Speech (POS).
     :param iter synsets: Possible synsets of the ambiguous word.
+    :param normalize: Optional function applied to each definition token
+    before the overlap, e.g. the stemmer the context was normalized with.
     :return: ``lesk_sense`` The Synset() object with the highest signature overlaps.
 
     This function is an implementation of the original Lesk algorithm (1986) [1].
@@ -38,15 +41,20 @@ def lesk(context_sentence, ambiguous_word, pos=None, synsets=None):
         synsets = wordnet.synsets(ambiguous_word)
 
     if pos:
-        for ss in synsets:
-            print ss.pos, pos
-        synsets = [ss for ss in synsets if str(ss.pos) == pos]
+        # Adjective satellites count as adjectives, as in wordnet.synsets
+        synsets = [ss for ss in synsets if ss.pos() == pos or
+                   (pos == wordnet.ADJ and ss.pos() == wordnet.ADJ_SAT)]
 
     if not synsets:
         return None
 
+    if normalize is None:
+        normalize = lambda token: token
+
     _, sense = max(
-        (len(context.intersection(ss.definition().split())), ss) for ss in synsets
+        (len(context.intersection(normalize(token) for token
+                                  in ss.definition().split())), ss)
+        for ss in synsets
     )
 
     return sense
@@ -0,0 +1,108 @@
+"""
+Precomputed WordNet signatures for the Lesk disambiguator: for each (word,
+WordNet pos) of the clue vocabulary, the names of its synsets and the set of
+tokens of each definition. Built once over the clue store and pickled, so
+disambiguating a clue only intersects sets
+"""
+
+import pickle
+from nltk.corpus import wordnet
+
+# Prefixes of the Penn Treebank tags (as produced by nltk.pos_tag) of the
+# parts of speech WordNet covers, with the WordNet pos letters (spelled out,
+# since reading wordnet.NOUN would load the corpus on import)
+PENN_TO_WORDNET = [('NN', 'n'), ('VB', 'v'), ('JJ', 'a'), ('RB', 'r')]
+
+def penn_to_wordnet(tag):
+	# WordNet pos of a Penn Treebank tag, or None for tags WordNet lacks
+
+	for prefix, wn_pos in PENN_TO_WORDNET:
+		if tag.startswith(prefix):
+			return wn_pos
+	return None
+
+def lesk_signatures(context, signatures):
+	# Lesk over precomputed signatures: the name of the synset whose
+	# definition shares the most tokens with the set context (ties go to
+	# the greatest name, as Synset comparison does in lesk), or None
+
+	if not signatures:
+		return None
+	_, name = max((len(context.intersection(tokens)), name) \
+		for (name, tokens) in signatures)
+	return name
+
+class SignatureIndex:
+	"""
+	Maps (word, WordNet pos) to the tuple of (synset name, frozenset of
+	definition tokens) of the synsets of the word with that pos (any pos
+	when it is None). Pairs missing from the index are looked up in WordNet
+	on first use and kept
+	"""
+	def __init__(self, normalize=None, source=None):
+		"""
+		normalize		optional function applied to each definition token,
+						matching how the clue tokens were normalized
+		source			optional fingerprint of the clues the index is built
+						from (such as clue_store.store_fingerprint), saved
+						with it
+		"""
+		self.normalize = normalize
+		self.source = source
+		self.signatures = {}
+
+	def lookup(self, word, wn_pos):
+		key = (word, wn_pos)
+		if key not in self.signatures:
+			normalize = self.normalize
+			signatures = []
+			for ss in wordnet.synsets(word, wn_pos):
+				tokens = ss.definition().split()
+				if normalize is not None:
+					tokens = [normalize(token) for token in tokens]
+				signatures.append((ss.name(), frozenset(tokens)))
+			self.signatures[key] = tuple(signatures)
+		return self.signatures[key]
+
+	def add_clues(self, data):
+		# precompute the signatures of every token of an iterable of
+		# (tagged clue, answer) pairs, such as a ClueStore
+
+		for clue_item, answer in data:
+			for (word, pos) in clue_item:
+				wn_pos = penn_to_wordnet(pos)
+				if wn_pos is not None:
+					self.lookup(word, wn_pos)
+
+	def disambiguate(self, clue_item):
+		# synset name of each token of a tagged clue, None for the tokens
+		# whose tag WordNet does not cover
+
+		context = set(word for (word, pos) in clue_item)
+		senses = []
+		for (word, pos) in clue_item:
+			wn_pos = penn_to_wordnet(pos)
+			if wn_pos is None:
+				senses.append(None)
+			else:
+				senses.append(lesk_signatures(context, self.lookup(word, \
+					wn_pos)))
+		return senses
+
+	def save(self, filename):
+		f = open(filename, 'wb')
+		pickle.dump((self.source, self.signatures), f, \
+			pickle.HIGHEST_PROTOCOL)
+		f.close()
+
+def load_signature_index(filename, normalize=None):
+	f = open(filename, 'rb')
+	index = SignatureIndex(normalize)
+	data = pickle.load(f)
+	f.close()
+	if isinstance(data, dict):
+		# saved before the index recorded its source
+		index.signatures = data
+	else:
+		index.source, index.signatures = data
+	return index
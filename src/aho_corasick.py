@@ -0,0 +1,72 @@
+"""
+Aho-Corasick automaton, which finds every occurrence of a fixed set of
+patterns in a text in a single pass over the text
+"""
+
+from collections import deque
+
+class AhoCorasick:
+	"""
+	Class to support multi-pattern matching. States are numbered from 0
+	(the root); for each state:
+	goto			dictionary mapping letters to the next state in the trie
+	fail			longest proper suffix of the state that is also a state
+	outputs			indices of the patterns ending exactly at the state
+	output_link		nearest state on the fail chain with outputs, or None,
+					so reporting the matches never walks useless states
+	"""
+	def __init__(self, patterns):
+		"""
+		patterns		list of nonempty strings (duplicates are allowed,
+						and reported once per index)
+		"""
+		self.patterns = list(patterns)
+		self.goto = [{}]
+		self.outputs = [[]]
+		for i, pattern in enumerate(self.patterns):
+			assert (len(pattern) > 0)
+			state = 0
+			for letter in pattern:
+				if letter not in self.goto[state]:
+					self.goto[state][letter] = len(self.goto)
+					self.goto.append({})
+					self.outputs.append([])
+				state = self.goto[state][letter]
+			self.outputs[state].append(i)
+
+		# Breadth-first, so the fail states of shallower states are known;
+		# the children of the root keep the root as their fail state
+		self.fail = [0] * len(self.goto)
+		self.output_link = [None] * len(self.goto)
+		queue = deque(self.goto[0].values())
+		while len(queue) > 0:
+			state = queue.popleft()
+			for letter, child in self.goto[state].items():
+				fail = self.step(self.fail[state], letter)
+				self.fail[child] = fail
+				if len(self.outputs[fail]) > 0:
+					self.output_link[child] = fail
+				else:
+					self.output_link[child] = self.output_link[fail]
+				queue.append(child)
+
+	def step(self, state, letter):
+		""" Returns the state reached by reading [letter] in [state]
+		"""
+		while state != 0 and letter not in self.goto[state]:
+			state = self.fail[state]
+		return self.goto[state].get(letter, 0)
+
+	def iter_matches(self, text):
+		""" Streams (end, pattern index) pairs for every occurrence of a
+		pattern in [text], where text[end] is its last letter
+		"""
+		state = 0
+		for end, letter in enumerate(text):
+			state = self.step(state, letter)
+			match = state if len(self.outputs[state]) > 0 else \
+				self.output_link[state]
+			while match is not None:
+				for i in self.outputs[match]:
+					yield end, i
+				match = self.output_link[match]
@@ -5,6 +5,325 @@ general n-ary factors into unary and binary factors
 """
 
 import copy
+import heapq
+import itertools
+import multiprocessing
+from collections import deque
+from array import array
+
+def popcount(mask):
+	""" Number of set bits in the nonnegative integer [mask]
+	"""
+	return bin(mask).count('1')
+
+class BitsetDomain:
+	"""
+	Domain of one variable, stored as an integer bitmask over an indexed table
+	of values: bit i is set exactly when values[i] is still in the domain.
+	Supports the list operations used by BacktrackSearch (iteration in table
+	order, membership, len, index, deletion by index and insert)
+	"""
+	def __init__(self, values, index_of=None, mask=None):
+		"""
+		values			list of all possible values; shared between copies
+		index_of		dictionary mapping each value to its bit index
+		mask			integer with one bit per value in the domain
+		"""
+		self.values = values
+		if index_of is None:
+			index_of = {val: i for i, val in enumerate(values)}
+		self.index_of = index_of
+		if mask is None:
+			mask = (1 << len(values)) - 1
+		self.mask = mask
+
+	def copy(self):
+		return BitsetDomain(self.values, self.index_of, self.mask)
+
+	def __deepcopy__(self, memo):
+		# The value table is never mutated, so copies only need a new mask
+		return self.copy()
+
+	def restricted_to(self, vals):
+		""" Returns a new domain over the same value table containing [vals]
+		"""
+		mask = 0
+		for val in vals:
+			mask |= 1 << self.index_of[val]
+		return BitsetDomain(self.values, self.index_of, mask)
+
+	def __len__(self):
+		return popcount(self.mask)
+
+	def __iter__(self):
+		mask = self.mask
+		while mask:
+			low_bit = mask & -mask
+			yield self.values[low_bit.bit_length() - 1]
+			mask ^= low_bit
+
+	def __contains__(self, val):
+		try:
+			return (self.mask >> self.index_of[val]) & 1 == 1
+		except KeyError:
+			return False
+
+	def index(self, val):
+		if val not in self:
+			raise ValueError('{0} is not in the domain'.format(val))
+		return self.index_of[val]
+
+	def __delitem__(self, idx):
+		self.mask &= ~(1 << idx)
+
+	def remove(self, val):
+		del self[self.index(val)]
+
+	def insert(self, idx, val):
+		self.mask |= 1 << idx
+
+	def __repr__(self):
+		return 'BitsetDomain({0})'.format(list(self))
+
+class BinaryFactorTable:
+	"""
+	Table of a binary factor, stored as a flat 2-D array of floats indexed
+	through value-to-index maps. Tables are never modified after they are 
+	built, so identical factors (e.g. all the != factors of a Sudoku) can
+	share a single table
+	"""
+	def __init__(self, row_values, col_values, data):
+		"""
+		row_values		list of the values of the first variable
+		col_values		list of the values of the second variable
+		data			array of len(row_values) * len(col_values) floats,
+						so that data[i * len(col_values) + j] = 
+						factor(row_values[i], col_values[j])
+		"""
+		self.row_values = row_values
+		self.col_values = col_values
+		self.row_index = {val: i for i, val in enumerate(row_values)}
+		self.col_index = {val: j for j, val in enumerate(col_values)}
+		self.num_cols = len(col_values)
+		self.data = data
+		self.row_masks = None
+		self.transposed = None
+
+	def get(self, val1, val2):
+		""" Returns factor(val1, val2)
+		"""
+		return self.data[self.row_index[val1] * self.num_cols + \
+			self.col_index[val2]]
+
+	def support_mask(self, val1):
+		""" Bitmask over col_values of the values with a nonzero factor 
+		against val1; bit j stands for col_values[j]
+		"""
+		if self.row_masks is None:
+			self.row_masks = []
+			for i in range(len(self.row_values)):
+				mask = 0
+				for j in range(self.num_cols):
+					if self.data[i * self.num_cols + j] != 0:
+						mask |= 1 << j
+				self.row_masks.append(mask)
+		return self.row_masks[self.row_index[val1]]
+
+	def transpose(self):
+		""" Returns the table of the same factor with the arguments swapped
+		"""
+		if self.transposed is None:
+			num_rows = len(self.row_values)
+			data = array('d', [self.data[i * self.num_cols + j] for j \
+				in range(self.num_cols) for i in range(num_rows)])
+			self.transposed = BinaryFactorTable(self.col_values, \
+				self.row_values, data)
+			self.transposed.transposed = self
+		return self.transposed
+
+	def key(self):
+		""" Hashable summary of the contents, used to share equal tables
+		"""
+		return (tuple(self.row_values), tuple(self.col_values), \
+			self.data.tostring())
+
+	def __deepcopy__(self, memo):
+		# Tables are immutable, so copies of a CSP can keep sharing them
+		return self
+
+class AllDifferent:
+	"""
+	Global constraint requiring all of its variables to take pairwise 
+	different values, propagated with Regin's matching-based filtering
+	"""
+	def __init__(self, vars):
+		"""
+		vars			list of distinct variables of the CSP
+		"""
+		self.vars = list(vars)
+
+	def is_consistent(self, assignment, var, val):
+		""" Checks whether var = val is compatible with [assignment]
+		assignment			partial assignment of variables;
+							(dictionary mapping vars to assigned values)
+		"""
+		for other in self.vars:
+			if other != var and other in assignment and \
+				assignment[other] == val:
+				return False
+		return True
+
+	def propagate(self, domains):
+		""" Finds every value that cannot take part in any solution of this
+		constraint, i.e. every variable-value edge that belongs to no maximum
+		matching of the variable-value graph
+		domains			maps each var to its reduced domain
+		Returns a list of (var, val) pairs to remove, or None if the variables
+		cannot all take different values
+		"""
+		match_var = {}
+		match_val = {}
+		for var in self.vars:
+			if not self.augment(var, domains, match_var, match_val, set()):
+				return None
+
+		# Alternating graph: vars point to their matched value, values point
+		# to the other vars that could take them
+		val_node = {}
+		adjacency = [[] for var in self.vars]
+		for i, var in enumerate(self.vars):
+			for val in domains[var]:
+				if val not in val_node:
+					val_node[val] = len(adjacency)
+					adjacency.append([])
+				if match_var[var] == val:
+					adjacency[i].append(val_node[val])
+				else:
+					adjacency[val_node[val]].append(i)
+
+		# Edges on an alternating path from a free value are always usable
+		reached = set(node for val, node in val_node.items() \
+			if val not in match_val)
+		stack = list(reached)
+		while stack:
+			for next_node in adjacency[stack.pop()]:
+				if next_node not in reached:
+					reached.add(next_node)
+					stack.append(next_node)
+
+		# So are edges on an alternating cycle, i.e. inside one SCC
+		components = strongly_connected_components(adjacency)
+		removals = []
+		for i, var in enumerate(self.vars):
+			for val in domains[var]:
+				node = val_node[val]
+				if match_var[var] == val or node in reached or \
+					components[node] == components[i]:
+					continue
+				removals.append((var, val))
+		return removals
+
+	def augment(self, var, domains, match_var, match_val, seen):
+		""" Looks for an augmenting path from [var] (Kuhn's algorithm),
+		updating the matching in place; returns whether one was found
+		"""
+		for val in domains[var]:
+			if val in seen:
+				continue
+			seen.add(val)
+			if val not in match_val or self.augment(match_val[val], domains, \
+				match_var, match_val, seen):
+				match_var[var] = val
+				match_val[val] = var
+				return True
+		return False
+
+def strongly_connected_components(adjacency):
+	""" Tarjan's algorithm; returns a list mapping each node to the index of
+	its strongly connected component
+	adjacency		list of lists; adjacency[node] holds the successors of node
+	"""
+	index = [None] * len(adjacency)
+	lowlink = [0] * len(adjacency)
+	components = [None] * len(adjacency)
+	stack = []
+	on_stack = [False] * len(adjacency)
+	counter = [0, 0]
+
+	def visit(node):
+		index[node] = lowlink[node] = counter[0]
+		counter[0] += 1
+		stack.append(node)
+		on_stack[node] = True
+		for next_node in adjacency[node]:
+			if index[next_node] is None:
+				visit(next_node)
+				lowlink[node] = min(lowlink[node], lowlink[next_node])
+			elif on_stack[next_node]:
+				lowlink[node] = min(lowlink[node], index[next_node])
+		if lowlink[node] == index[node]:
+			while True:
+				member = stack.pop()
+				on_stack[member] = False
+				components[member] = counter[1]
+				if member == node:
+					break
+			counter[1] += 1
+
+	for node in range(len(adjacency)):
+		if index[node] is None:
+			visit(node)
+	return components
+
+class SumConstraint:
+	"""
+	Global constraint requiring the (numerical) values of its variables to 
+	add up to [total], propagated with bounds reasoning
+	"""
+	def __init__(self, vars, total):
+		"""
+		vars			list of distinct variables of the CSP
+		total			required sum of their values
+		"""
+		self.vars = list(vars)
+		self.total = total
+
+	def is_consistent(self, assignment, var, val):
+		""" Checks whether var = val is compatible with [assignment]; only a 
+		full assignment of the variables can be checked without domains
+		"""
+		partial_sum = val
+		for other in self.vars:
+			if other == var:
+				continue
+			if other not in assignment:
+				return True
+			partial_sum += assignment[other]
+		return partial_sum == self.total
+
+	def propagate(self, domains):
+		""" Removes the values that cannot reach the total, whatever the
+		other variables take within their domains
+		domains			maps each var to its reduced domain
+		Returns a list of (var, val) pairs to remove, or None if the total 
+		cannot be reached
+		"""
+		if any(len(domains[var]) == 0 for var in self.vars):
+			return None
+		lows = [min(domains[var]) for var in self.vars]
+		highs = [max(domains[var]) for var in self.vars]
+		min_sum = sum(lows)
+		max_sum = sum(highs)
+		if not min_sum <= self.total <= max_sum:
+			return None
+		removals = []
+		for i, var in enumerate(self.vars):
+			low = self.total - (max_sum - highs[i])
+			high = self.total - (min_sum - lows[i])
+			for val in domains[var]:
+				if val < low or val > high:
+					removals.append((var, val))
+		return removals
 
 class CSP:
 	"""
@@ -18,14 +337,29 @@ class CSP:
 		unary_factors	maps each var to a dictionary of val: factor(val);
 						in other words, unary_factors[var][val] = factor(val)
 		binary_factors	maps each var1 to a dictionary with keys var2;
-						each binary_factors[var1][var2] is a table so that
-						binary_factors[var1][var2][val1][val2] = 
+						each binary_factors[var1][var2] is a 
+						BinaryFactorTable so that
+						binary_factors[var1][var2].get(val1, val2) = 
 						factor(val1, val2)
+		shared_tables	maps the contents of every table built so far to
+						that table, so equal factors share storage
+		factor_tables	maps (factor function, domain1, domain2) to the 
+						table already built for it, so repeated factors
+						are not reevaluated
+		constraints		list of global constraints over several variables
+						(such as AllDifferent), each with a list [vars], 
+						is_consistent(assignment, var, val) and
+						propagate(domains)
+		var_constraints	maps each var to the list of constraints on it
 		"""
 		self.vars = []
 		self.domains = {}
 		self.unary_factors = {}
 		self.binary_factors = {}
+		self.shared_tables = {}
+		self.factor_tables = {}
+		self.constraints = []
+		self.var_constraints = {}
 
 	def add_variable(self, var, domain):
 		"""
@@ -37,19 +371,70 @@ class CSP:
 		self.domains[var] = domain[:]
 		self.unary_factors[var] = None
 		self.binary_factors[var] = dict()
+		self.var_constraints[var] = []
 
 	def add_unary_factor(self, var, new_factor):
 		"""
 		var			hashable object in self.vars
 		new_factor	numerical function that takes any value for var 
 		"""
-		if self.unary_factors[var] == None:
-			self.unary_factors[var] = {val: float(new_factor(val)) for val \
-				in self.domains[var]}
-		else:
+		new_table = {val: float(new_factor(val)) for val in self.domains[var]}
+		if self.unary_factors[var] != None:
+			# Build a new table, since copies of this CSP may share the old one
 			for val in self.domains[var]:
 				assert (val in self.unary_factors[var])
-				self.unary_factors[var][val] *= new_factor(val)
+				new_table[val] *= self.unary_factors[var][val]
+		self.unary_factors[var] = new_table
+
+	def copy(self):
+		""" Returns a copy of the CSP that can be extended independently.
+		Factor tables, constraints and domain lists are never modified in 
+		place, so the copy shares them and only duplicates the dictionaries
+		that index them
+		"""
+		new_csp = CSP()
+		new_csp.vars = list(self.vars)
+		new_csp.domains = dict(self.domains)
+		new_csp.unary_factors = dict(self.unary_factors)
+		new_csp.binary_factors = {var: dict(self.binary_factors[var]) \
+			for var in self.vars}
+		new_csp.shared_tables = self.shared_tables
+		new_csp.factor_tables = self.factor_tables
+		new_csp.constraints = list(self.constraints)
+		new_csp.var_constraints = {var: list(self.var_constraints[var]) \
+			for var in self.vars}
+		return new_csp
+
+	def __getstate__(self):
+		# factor_tables is keyed by factor functions, which may be lambdas
+		# that cannot be pickled; it is only a cache, so leave it out
+		state = self.__dict__.copy()
+		state['factor_tables'] = {}
+		return state
+
+	def add_constraint(self, constraint):
+		"""
+		constraint		global constraint whose vars are all in self.vars
+		"""
+		for var in constraint.vars:
+			assert (var in self.var_constraints)
+			self.var_constraints[var].append(constraint)
+		self.constraints.append(constraint)
+
+	def add_all_different(self, vars):
+		"""
+		vars			list of distinct hashable objects in self.vars,
+						which must all take different values
+		"""
+		self.add_constraint(AllDifferent(vars))
+
+	def add_sum_constraint(self, vars, total):
+		"""
+		vars			list of distinct hashable objects in self.vars, with
+						numerical values
+		total			required sum of the values of vars
+		"""
+		self.add_constraint(SumConstraint(vars, total))
 
 	def add_binary_factor(self, var1, var2, new_factor):
 		"""
@@ -58,42 +443,185 @@ class CSP:
 						any value for var2 
 		"""
 		assert (var1 != var2)
-		new_table_var1 = {val1: {val2: new_factor(val1, val2) for val2 \
-			in self.domains[var2]} for val1 in self.domains[var1]}
-		self.update_binary_table(var1, var2, new_table_var1)
-		new_table_var2 = {val2: {val1: new_factor(val1, val2) for val1 \
-			in self.domains[var1]} for val2 in self.domains[var2]}
-		self.update_binary_table(var2, var1, new_table_var2)
+		new_table = self.make_binary_table(self.domains[var1], \
+			self.domains[var2], new_factor)
+		self.update_binary_table(var1, var2, new_table)
+		self.update_binary_table(var2, var1, new_table.transpose())
+
+	def make_binary_table(self, domain1, domain2, new_factor):
+		""" Helper function for add_binary_factor, returning a shared table
+		domain1			list of values for the first argument
+		domain2			list of values for the second argument
+		new_factor		numerical function that takes any value in domain1
+						and any value in domain2
+		"""
+		factor_key = (new_factor, tuple(domain1), tuple(domain2))
+		if factor_key not in self.factor_tables:
+			data = array('d', [new_factor(val1, val2) for val1 in domain1 \
+				for val2 in domain2])
+			table = BinaryFactorTable(list(domain1), list(domain2), data)
+			self.factor_tables[factor_key] = self.share_table(table)
+		return self.factor_tables[factor_key]
+
+	def share_table(self, table):
+		""" Returns the table already stored with the same contents as 
+		[table], or stores [table] if there is none
+		"""
+		return self.shared_tables.setdefault(table.key(), table)
 
 	def update_binary_table(self, var1, var2, new_table):
 		""" Helper function for add_binary_factor
 		var1, var2		distinct hashable objects in self.vars
-		new_table		dictionary so that 
-						new_table[val1][val2] = new_factor(val1, val2)
+		new_table		BinaryFactorTable over the domains of var1 and var2
 		"""
 		if var2 not in self.binary_factors[var1]:
 			self.binary_factors[var1][var2] = new_table
 		else:
-			for val1 in self.domains[var1]:
-				assert (val1 in self.binary_factors[var1][var2])
-				for val2 in self.domains[var2]:
-					assert (val2 in self.binary_factors[var1][var2][val1])
-					new_mult = new_table[val1][val2]
-					self.binary_factors[var1][var2][val1][val2] *= new_mult
+			old_table = self.binary_factors[var1][var2]
+			assert (old_table.row_values == new_table.row_values)
+			assert (old_table.col_values == new_table.col_values)
+			data = array('d', [old * new for old, new in \
+				zip(old_table.data, new_table.data)])
+			self.binary_factors[var1][var2] = self.share_table( \
+				BinaryFactorTable(old_table.row_values, \
+				old_table.col_values, data))
 
 class BacktrackSearch:
-	def __init__(self, csp):
+	def __init__(self, csp, use_trail=True, use_bitsets=False, \
+		mrv_queue=False, degree_tiebreak=False, arc_consistency='ac3'):
 		"""
 		solutions			list of pairs (full assignment, weight)
-		csp					deep copy of the CSP to solve
+		csp					copy of the CSP to solve (see CSP.copy)
 		reduced_domains		valid domains of the variables during the search;
 							dictionary mapping variables to lists of values
-
+		use_trail			if True, domain reductions are recorded on
+							[trail] and undone when backtracking; otherwise
+							the domains are deep copied at every branch
+		trail				undo log of (var, index, val) triples, one for
+							each value removed from a reduced domain
+		use_bitsets			if True, reduced domains are BitsetDomains over
+							the original domain of each variable, instead
+							of lists
+		full_domains		maps each var to a BitsetDomain holding its whole
+							domain, whose value table all reduced domains
+							of that var share (only if use_bitsets is True)
+		unary_masks			cache mapping each var to the bitmask of values
+							with a nonzero unary factor
+		num_backtracks		number of assignments undone without leading to
+							a solution during the last search
+		mrv_queue			if True, the most constrained variable is taken
+							from [mrv_heap] instead of scanning all the 
+							variables (requires use_trail)
+		degree_tiebreak		if True, ties between equally constrained 
+							variables go to the one with the most neighbors
+		mrv_heap			heap of (domain size, tiebreak, index, var) 
+							entries, pushed whenever a domain changes size;
+							entries that no longer match are skipped lazily
+		var_keys			maps each var to its (tiebreak, index) pair
+		arc_consistency		'ac3' to revise arcs with arc_consistency_check,
+							or 'ac2001' to use arc_consistency_check_2001
+		last_support		maps (var1, var2, val1) to the last value of var2
+							found to support var1 = val1 (AC-2001 only)
 		"""
 		self.solutions = []
-		self.csp = copy.deepcopy(csp) 
-		self.reduced_domains = {var: list(self.csp.domains[var]) for var \
-			in self.csp.vars}
+		self.csp = csp.copy()
+		self.use_trail = use_trail
+		self.use_bitsets = use_bitsets
+		self.trail = []
+		self.unary_masks = {}
+		self.num_backtracks = 0
+		assert (use_trail or not mrv_queue)
+		self.mrv_queue = mrv_queue
+		self.mrv_heap = None
+		self.var_keys = {}
+		assert (arc_consistency in ('ac3', 'ac2001'))
+		self.arc_consistency = arc_consistency
+		self.last_support = {}
+		for i, var in enumerate(self.csp.vars):
+			neighbors = set(self.csp.binary_factors[var])
+			for constraint in self.csp.var_constraints[var]:
+				neighbors.update(constraint.vars)
+			neighbors.discard(var)
+			tiebreak = -len(neighbors) if degree_tiebreak else 0
+			self.var_keys[var] = (tiebreak, i)
+		if use_bitsets:
+			self.full_domains = {var: BitsetDomain(list(self.csp.domains[var])) \
+				for var in self.csp.vars}
+		self.reduced_domains = {var: self.new_domain(var, \
+			self.csp.domains[var]) for var in self.csp.vars}
+
+	def new_domain(self, var, vals):
+		""" Builds a reduced domain for [var] holding [vals], in the
+		representation selected by self.use_bitsets
+		var				variable in self.csp.vars
+		vals			iterable of values in self.csp.domains[var]
+		"""
+		if not self.use_bitsets:
+			return list(vals)
+		return self.full_domains[var].restricted_to(vals)
+
+	def get_support_mask(self, var1, var2, val1):
+		""" Bitmask over the value table of var2 of all values with a nonzero
+		factor against var1 = val1 (only used when self.use_bitsets is True)
+		"""
+		return self.csp.binary_factors[var1][var2].support_mask(val1)
+
+	def remove_value(self, var, val):
+		""" Removes [val] from the reduced domain of [var], recording the 
+		removal on the trail when it is enabled
+		var				variable whose domain is being pruned
+		val				value in self.reduced_domains[var]
+		"""
+		domain = self.reduced_domains[var]
+		idx = domain.index(val)
+		del domain[idx]
+		if self.use_trail:
+			self.trail.append((var, idx, val))
+		if self.mrv_heap is not None:
+			self.push_mrv_entry(var)
+
+	def undo_trail(self, mark):
+		""" Reinserts every value removed since the trail had length [mark],
+		in reverse order, so each domain is restored exactly (including order)
+		mark			length of the trail to roll back to
+		"""
+		while len(self.trail) > mark:
+			var, idx, val = self.trail.pop()
+			self.reduced_domains[var].insert(idx, val)
+			if self.mrv_heap is not None:
+				self.push_mrv_entry(var)
+
+	def push_mrv_entry(self, var):
+		""" Records the current domain size of [var] in the MRV heap, 
+		rebuilding the heap once stale entries dominate it
+		"""
+		if len(self.mrv_heap) > 4 * len(self.csp.vars) + 64:
+			self.rebuild_mrv_heap()
+			return
+		heapq.heappush(self.mrv_heap, (len(self.reduced_domains[var]),) + \
+			self.var_keys[var] + (var,))
+
+	def rebuild_mrv_heap(self):
+		""" Replaces the MRV heap by one fresh entry per variable
+		"""
+		self.mrv_heap = [(len(self.reduced_domains[var]),) + \
+			self.var_keys[var] + (var,) for var in self.csp.vars]
+		heapq.heapify(self.mrv_heap)
+
+	def pop_mrv_variable(self, assignment):
+		""" Finds the unassigned variable with the smallest domain using the 
+		MRV heap. Since every assignment is propagated, the reduced domains
+		only hold values with a nonzero delta weight, so this matches
+		get_mcv_variable
+		assignment			partial assignment of variables;
+							(dictionary mapping vars to assigned values)
+		"""
+		while True:
+			size, tiebreak, idx, var = self.mrv_heap[0]
+			if var in assignment or size != len(self.reduced_domains[var]):
+				heapq.heappop(self.mrv_heap)
+				continue
+			return var
 
 	def get_delta_weight(self, assignment, var, val):
 		""" Number multiplied by weight if we assign a new variable 
@@ -111,21 +639,62 @@ class BacktrackSearch:
 			if neighbor in assignment:
 				assert (assignment[neighbor] in self.reduced_domains[neighbor])
 				factor = self.csp.binary_factors[var][neighbor]
-				delta *= factor[val][assignment[neighbor]]
+				delta *= factor.get(val, assignment[neighbor])
 				if delta == 0.0:
 					return delta
+		for constraint in self.csp.var_constraints[var]:
+			if not constraint.is_consistent(assignment, var, val):
+				return 0.0
 		return delta
 
+	def get_valid_mask(self, assignment, var):
+		""" Bitmask of the values of [var] with a nonzero delta weight, 
+		computed with word operations (only used when self.use_bitsets is True)
+		assignment			partial assignment of variables;
+							(dictionary mapping vars to assigned values)
+		var					variable not yet in [assignment]
+		"""
+		if var not in self.unary_masks:
+			mask = self.full_domains[var].mask
+			if self.csp.unary_factors[var] != None:
+				mask = self.full_domains[var].restricted_to([val for val \
+					in self.csp.domains[var] if \
+					self.csp.unary_factors[var][val] != 0]).mask
+			self.unary_masks[var] = mask
+		mask = self.reduced_domains[var].mask & self.unary_masks[var]
+		for neighbor in self.csp.binary_factors[var]:
+			if mask == 0:
+				break
+			if neighbor in assignment:
+				mask &= self.get_support_mask(neighbor, var, \
+					assignment[neighbor])
+		if mask and self.csp.var_constraints[var]:
+			domain = self.full_domains[var]
+			for val in BitsetDomain(domain.values, domain.index_of, mask):
+				for constraint in self.csp.var_constraints[var]:
+					if not constraint.is_consistent(assignment, var, val):
+						mask &= ~(1 << domain.index_of[val])
+						break
+		return mask
+
 	def get_mcv_variable(self, assignment):
 		""" Finds the most constrained variable to assign next
 		assignment			partial assignment of variables;
 							(dictionary mapping vars to assigned values)
 		"""
+		if self.mrv_heap is not None:
+			return self.pop_mrv_variable(assignment)
 		valid_vars = [var for var in self.csp.vars if var not in assignment]
-		num_valid = [len([val for val in self.reduced_domains[var] \
-			if self.get_delta_weight(assignment, var, val) != 0]) for var in valid_vars]
-		num_valid_idx = [(num_valid[i], i) for i in range(len(valid_vars))]
-		return valid_vars[min(num_valid_idx)[1]]
+		if self.use_bitsets:
+			num_valid = [popcount(self.get_valid_mask(assignment, var)) \
+				for var in valid_vars]
+		else:
+			num_valid = [len([val for val in self.reduced_domains[var] \
+				if self.get_delta_weight(assignment, var, val) != 0]) \
+				for var in valid_vars]
+		num_valid_idx = [(num_valid[i], self.var_keys[valid_vars[i]][0], i) \
+			for i in range(len(valid_vars))]
+		return valid_vars[min(num_valid_idx)[2]]
 	
 	def order_domain_by_lcv(self, var):
 		""" Produces the domain of [var], with least constrained values first
@@ -136,15 +705,23 @@ class BacktrackSearch:
 		for val in total_domains:
 			for neighbor in neighbors:
 				factor = self.csp.binary_factors[var][neighbor]
+				if self.use_bitsets:
+					# Assumes nonnegative factors, so nonzero means positive
+					total_domains[val] += popcount(self.get_support_mask(var, \
+						neighbor, val) & self.reduced_domains[neighbor].mask)
+					continue
 				total_domains[val] += len([neigh_val for neigh_val \
-					in self.reduced_domains[neighbor] if factor[val][neigh_val] > 0])
+					in self.reduced_domains[neighbor] if factor.get(val, neigh_val) > 0])
 		return sorted(self.reduced_domains[var], key=lambda val: -total_domains[val])
 
-	def arc_consistency_check(self, var):
+	def arc_consistency_check(self, *vars):
 		""" Executes the AC-3 algorithm for arc consistency (lookahead)
-		var				the variable to be assigned next
+		vars			the variables whose domains just changed, such as
+						the variable that was just assigned
+		Returns the list of other variables whose domains were reduced
 		"""
-		var_queue = [var]
+		var_queue = list(vars)
+		modified_vars = []
 		while len(var_queue) > 0:
 			new_var = var_queue.pop(0)
 			for neighbor in self.csp.binary_factors[new_var].keys():
@@ -156,28 +733,152 @@ class BacktrackSearch:
 							to_remove.append(val)
 							modified_domain = True
 							continue
-					if self.csp.binary_factors[neighbor][new_var] != None:
+					if self.use_bitsets:
+						has_arc = (self.get_support_mask(neighbor, new_var, \
+							val) & self.reduced_domains[new_var].mask) != 0
+						if not has_arc:
+							to_remove.append(val)
+							modified_domain = True
+					elif self.csp.binary_factors[neighbor][new_var] != None:
 						has_arc = False
 						for new_val in self.reduced_domains[new_var]:
-							if self.csp.binary_factors[neighbor][new_var][val][new_val] != 0:
+							if self.csp.binary_factors[neighbor][new_var].get(val, new_val) != 0:
 								has_arc = True
 						if not has_arc:
 							to_remove.append(val)
 							modified_domain = True
 				for elem in to_remove:
-					self.reduced_domains[neighbor].remove(elem)
+					self.remove_value(neighbor, elem)
+				if modified_domain and neighbor not in modified_vars:
+					modified_vars.append(neighbor)
 				if modified_domain and neighbor not in var_queue:
 					var_queue.append(neighbor)
+		return modified_vars
+
+	def arc_consistency_check_2001(self, *vars):
+		""" Executes the AC-2001 algorithm for arc consistency (lookahead):
+		the variables whose domains changed wait in a FIFO worklist, each one
+		triggering a revision of the arcs pointing to it, and each revision
+		first checks the last support found for a value, then scans the rest
+		of the other domain (wrapping around, so the pointers stay valid
+		after backtracking) and stops at the first support
+		vars			the variables whose domains just changed, such as
+						the variable that was just assigned
+		Returns the list of other variables whose domains were reduced
+		"""
+		var_queue = deque(vars)
+		queued = set(vars)
+		modified_vars = []
+		while len(var_queue) > 0:
+			other = var_queue.popleft()
+			queued.discard(other)
+			for var in self.csp.binary_factors[other]:
+				if not self.revise_2001(var, other):
+					continue
+				if var not in modified_vars:
+					modified_vars.append(var)
+				if var not in queued:
+					var_queue.append(var)
+					queued.add(var)
+		return modified_vars
+
+	def revise_2001(self, var, other):
+		""" Removes the values of [var] without support in the domain of 
+		[other]; returns whether the domain of [var] changed
+		"""
+		unary = self.csp.unary_factors[var]
+		table = self.csp.binary_factors[var][other]
+		other_domain = self.reduced_domains[other]
+		to_remove = []
+		if self.use_bitsets:
+			for val in self.reduced_domains[var]:
+				if (unary != None and unary[val] == 0) or \
+					table.support_mask(val) & other_domain.mask == 0:
+					to_remove.append(val)
+		else:
+			# Membership in the other domain is tested against a set, and the
+			# search for a new support against a bitmask over the columns of
+			# the table, each built at most once per revision
+			last_support = self.last_support
+			col_values = table.col_values
+			col_index = table.col_index
+			other_set = set(other_domain)
+			other_mask = None
+			for val in self.reduced_domains[var]:
+				if unary != None and unary[val] == 0:
+					to_remove.append(val)
+					continue
+				last = last_support.get((var, other, val))
+				if last in other_set:
+					continue
+				if other_mask is None:
+					other_mask = 0
+					for other_val in other_set:
+						j = col_index.get(other_val)
+						if j is not None:
+							other_mask |= 1 << j
+				supports = table.support_mask(val) & other_mask
+				if supports == 0:
+					to_remove.append(val)
+					continue
+				# First support after the last one, wrapping around
+				start = 0 if last is None else col_index[last] + 1
+				after = supports >> start << start
+				if after != 0:
+					supports = after
+				j = (supports & -supports).bit_length() - 1
+				last_support[(var, other, val)] = col_values[j]
+		for val in to_remove:
+			self.remove_value(var, val)
+		return len(to_remove) > 0
+
+	def propagate(self, vars):
+		""" Prunes the reduced domains after the domains of [vars] changed, 
+		alternating arc consistency with the propagation of the global 
+		constraints on every modified variable until nothing changes
+		vars			list of variables whose domains just changed
+		Returns False if some domain is wiped out or a global constraint 
+		cannot be satisfied, True otherwise
+		"""
+		changed = list(vars)
+		while len(changed) > 0:
+			if self.arc_consistency == 'ac2001':
+				revised = self.arc_consistency_check_2001(*changed)
+			else:
+				revised = self.arc_consistency_check(*changed)
+			modified_vars = changed + [var for var in revised \
+				if var not in changed]
+			if any(len(self.reduced_domains[var]) == 0 for var \
+				in modified_vars):
+				return False
+			constraints = []
+			for var in modified_vars:
+				for constraint in self.csp.var_constraints[var]:
+					if all(constraint is not other for other in constraints):
+						constraints.append(constraint)
+			changed = []
+			for constraint in constraints:
+				removals = constraint.propagate(self.reduced_domains)
+				if removals is None:
+					return False
+				for var, val in removals:
+					if val in self.reduced_domains[var]:
+						self.remove_value(var, val)
+						if var not in changed:
+							changed.append(var)
+		return True
 
 	def backtrack(self, assignment, weight):
-		""" Performs backtracking search, adding variables to [assignment]
+		""" Performs backtracking search, adding variables to [assignment];
+		this is a generator yielding each solution below the current node
+		as a pair (full assignment, weight), as soon as it is found
 		assignment			partial assignment of variables;
 							(dictionary mapping vars to assigned values)
 		weight				weight of the CSP, with the currently assigned vars
 		"""
 		assert (weight > 0)
 		if len(assignment) == len(self.csp.vars):
-			self.solutions.append((assignment.copy(), weight))
+			yield (assignment.copy(), weight)
 			return
 		var = self.get_mcv_variable(assignment)
 		values = self.order_domain_by_lcv(var)
@@ -185,23 +886,202 @@ class BacktrackSearch:
 			delta_weight = self.get_delta_weight(assignment, var, val)
 			if delta_weight > 0:
 				assignment[var] = val
-				orig_domains = copy.deepcopy(self.reduced_domains)
-				self.reduced_domains[var] = [val]
-				self.arc_consistency_check(var)
-				self.backtrack(assignment, weight * delta_weight)
-				self.reduced_domains = orig_domains
+				found = False
+				if self.use_trail:
+					mark = len(self.trail)
+					for other_val in list(self.reduced_domains[var]):
+						if other_val != val:
+							self.remove_value(var, other_val)
+				else:
+					orig_domains = copy.deepcopy(self.reduced_domains)
+					self.reduced_domains[var] = self.new_domain(var, [val])
+				if self.propagate([var]):
+					for solution in self.backtrack(assignment, \
+						weight * delta_weight):
+						found = True
+						yield solution
+				if not found:
+					self.num_backtracks += 1
+				if self.use_trail:
+					self.undo_trail(mark)
+				else:
+					self.reduced_domains = orig_domains
 				del assignment[var]
+				if self.mrv_heap is not None:
+					self.push_mrv_entry(var)
 
-	def solve(self):
-		""" Solves the CSP, calling self.backtrack with an empty assignment
+	def reset(self):
+		""" Restores the full domains, then removes the values with a zero
+		unary factor and propagates; returns False if the CSP is found to
+		have no solution
+		"""
+		self.num_backtracks = 0
+		self.reduced_domains = {var: self.new_domain(var, \
+			self.csp.domains[var]) for var in self.csp.vars}
+		self.trail = []
+		self.mrv_heap = None
+		for var in self.csp.vars:
+			if self.csp.unary_factors[var] != None:
+				for val in list(self.reduced_domains[var]):
+					if self.csp.unary_factors[var][val] == 0:
+						self.remove_value(var, val)
+		return self.propagate(self.csp.vars)
+
+	def search(self, max_solutions=None):
+		""" Starts a new search, after removing the values with a zero unary 
+		factor and propagating; yields (full assignment, weight) pairs in 
+		the order they are found
+		max_solutions		if not None, the search stops after finding this
+							many solutions
+		"""
+		if max_solutions is not None and max_solutions <= 0:
+			return
+		if not self.reset():
+			return
+		if self.mrv_queue:
+			self.rebuild_mrv_heap()
+		num_found = 0
+		for solution in self.backtrack({}, 1.0):
+			yield solution
+			num_found += 1
+			if num_found == max_solutions:
+				return
+
+	def iter_solutions(self, max_solutions=None):
+		""" Streams the full assignments of the solutions in search order,
+		without storing them
+		max_solutions		if not None, the maximum number of solutions
+		"""
+		for assignment, weight in self.search(max_solutions):
+			yield assignment
+
+	def solve(self, max_solutions=None):
+		""" Solves the CSP, storing the solutions in self.solutions
+		max_solutions		if not None, the search stops after finding this
+							many solutions (e.g. 2 to check uniqueness)
+		"""
+		self.solutions = list(self.search(max_solutions))
+
+	def split(self, num_subproblems):
+		""" Expands the top of the search tree breadth-first, replacing each
+		node by its children in the order backtrack would visit them, until
+		there are at least [num_subproblems] nodes (or nothing left to 
+		expand). Must be called after reset()
+		Returns the list of nodes as (assignment, weight, domains) triples,
+		where domains maps each var to a list of its remaining values
+		"""
+		root = ({}, 1.0, {var: list(self.reduced_domains[var]) for var \
+			in self.csp.vars})
+		frontier = [root]
+		expanded = True
+		while expanded and len(frontier) < num_subproblems:
+			expanded = False
+			next_frontier = []
+			for assignment, weight, domains in frontier:
+				if len(assignment) == len(self.csp.vars):
+					next_frontier.append((assignment, weight, domains))
+					continue
+				expanded = True
+				self.load_domains(domains)
+				var = self.get_mcv_variable(assignment)
+				for val in self.order_domain_by_lcv(var):
+					self.load_domains(domains)
+					delta_weight = self.get_delta_weight(assignment, var, val)
+					if delta_weight == 0:
+						continue
+					child = dict(assignment)
+					child[var] = val
+					self.reduced_domains[var] = self.new_domain(var, [val])
+					if not self.propagate([var]):
+						self.num_backtracks += 1
+						continue
+					next_frontier.append((child, weight * delta_weight, \
+						{other: list(self.reduced_domains[other]) for other \
+						in self.csp.vars}))
+			frontier = next_frontier
+		return frontier
+
+	def load_domains(self, domains):
+		""" Sets the reduced domains from a map of vars to lists of values
+		"""
+		self.reduced_domains = {var: self.new_domain(var, domains[var]) \
+			for var in self.csp.vars}
+		self.trail = []
+
+	def solve_subproblem(self, subproblem, max_solutions=None):
+		""" Runs backtrack below one node returned by split
+		subproblem			(assignment, weight, domains) triple
+		max_solutions		if not None, the maximum number of solutions
+		Returns the list of (full assignment, weight) pairs in search order
+		"""
+		assignment, weight, domains = subproblem
+		self.num_backtracks = 0
+		self.load_domains(domains)
+		self.mrv_heap = None
+		if self.mrv_queue:
+			self.rebuild_mrv_heap()
+		solutions = self.backtrack(dict(assignment), weight)
+		return list(itertools.islice(solutions, max_solutions))
+
+	def solve_parallel(self, jobs, max_solutions=None, split_factor=8):
+		""" Solves the CSP with a pool of [jobs] worker processes. The top of
+		the tree is split into about jobs * split_factor subtrees, which 
+		workers pick up one at a time as they become free; the results are 
+		merged in subtree order, so self.solutions ends up in the same order
+		as with solve()
+		jobs				number of worker processes
+		max_solutions		if not None, the search stops after finding this
+							many solutions
+		split_factor		number of subtrees per worker, to even out the
+							load between workers
 		"""
 		self.solutions = []
-		self.reduced_domains = {var: list(self.csp.domains[var]) for var \
-			in self.csp.vars}
-		self.backtrack({}, 1.0)
+		if max_solutions is not None and max_solutions <= 0:
+			return
+		if not self.reset():
+			return
+		subproblems = self.split(jobs * split_factor)
+		num_backtracks = self.num_backtracks
+		pool = multiprocessing.Pool(jobs, initializer=init_parallel_worker, \
+			initargs=(self, max_solutions))
+		try:
+			for solutions, worker_backtracks in pool.imap( \
+				solve_parallel_subproblem, subproblems):
+				num_backtracks += worker_backtracks
+				self.solutions.extend(solutions)
+				if max_solutions is not None and \
+					len(self.solutions) >= max_solutions:
+					del self.solutions[max_solutions:]
+					break
+		finally:
+			pool.terminate()
+			pool.join()
+		self.num_backtracks = num_backtracks
+
+	def has_unique_solution(self):
+		""" Checks whether the CSP has exactly one solution, stopping the 
+		search as soon as a second one is found
+		"""
+		return len(list(self.iter_solutions(max_solutions=2))) == 1
 
 	def get_solutions(self):
 		""" Orders the solutions by weight and returns the full assignments
 		"""
 		self.solutions = sorted(self.solutions, key=lambda sol: sol[0])
 		return [assign for assign, weight in self.solutions]
+
+# State of each worker process of BacktrackSearch.solve_parallel
+parallel_worker = {}
+
+def init_parallel_worker(search, max_solutions):
+	parallel_worker['search'] = search
+	parallel_worker['max_solutions'] = max_solutions
+
+def solve_parallel_subproblem(subproblem):
+	""" Solves one subtree in a worker process; returns the solutions and 
+	the number of backtracks
+	"""
+	search = parallel_worker['search']
+	solutions = search.solve_subproblem(subproblem, \
+		parallel_worker['max_solutions'])
+	return solutions, search.num_backtracks
@@ -0,0 +1,269 @@
+"""
+Compact, minimized word automaton (DAWG: directed acyclic word graph) for
+dictionary lookups. The automaton is compiled into one flat binary buffer,
+so it can be saved to disk and memory-mapped back in milliseconds, with the
+pages shared between every process using the same file
+
+Buffer layout (little-endian, each section padded to 4 bytes):
+	header			magic, num_nodes, num_edges, alphabet length (uint32s)
+	alphabet		one byte per letter; letter i has the integer code i
+	node_first		uint32[num_nodes + 1]; the edges of node n are the edges
+					node_first[n] to node_first[n + 1] - 1
+	node_final		uint8[num_nodes]; 1 if a word ends at the node
+	edge_labels		uint8[num_edges]; letter code of each edge, sorted
+					within each node
+	edge_targets	uint32[num_edges]; node reached by each edge
+Node 0 is the root
+"""
+
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import tempfile
+from array import array
+
+MAGIC = 0x47574144 # 'DAWG'
+
+def padded(length):
+	return (length + 3) / 4 * 4
+
+class BuildNode:
+	""" Mutable node used while building the automaton
+	"""
+	def __init__(self):
+		self.edges = {}
+		self.final = False
+		self.id = None
+
+	def signature(self):
+		return (self.final, tuple(sorted((letter, child.id) for letter, \
+			child in self.edges.items())))
+
+def build_nodes(words):
+	""" Builds the minimal automaton of [words] with the incremental
+	algorithm of Daciuk et al. for sorted input; returns the list of
+	distinct nodes, the root first
+	"""
+	root = BuildNode()
+	nodes = [root]
+	register = {}
+	unchecked = []
+
+	def minimize(down_to):
+		while len(unchecked) > down_to:
+			parent, letter, child = unchecked.pop()
+			signature = child.signature()
+			if signature in register:
+				parent.edges[letter] = register[signature]
+			else:
+				child.id = len(nodes)
+				nodes.append(child)
+				register[signature] = child
+
+	previous = ''
+	for word in sorted(set(words)):
+		common = 0
+		while common < min(len(word), len(previous)) and \
+			word[common] == previous[common]:
+			common += 1
+		minimize(common)
+		node = unchecked[-1][2] if len(unchecked) > 0 else root
+		for letter in word[common:]:
+			child = BuildNode()
+			node.edges[letter] = child
+			unchecked.append((node, letter, child))
+			node = child
+		node.final = True
+		previous = word
+	minimize(0)
+	root.id = 0
+	return nodes
+
+def compile_dawg(words):
+	""" Returns the binary buffer of the minimal automaton of [words]
+	words			iterable of byte strings
+	"""
+	nodes = build_nodes(words)
+	alphabet = ''.join(sorted(set(letter for node in nodes for letter \
+		in node.edges)))
+	assert (len(alphabet) <= 256)
+	codes = {letter: code for code, letter in enumerate(alphabet)}
+	node_first = array('I', [0])
+	node_final = array('B')
+	edge_labels = array('B')
+	edge_targets = array('I')
+	for node in nodes:
+		for letter, child in sorted(node.edges.items()):
+			edge_labels.append(codes[letter])
+			edge_targets.append(child.id)
+		node_first.append(len(edge_labels))
+		node_final.append(1 if node.final else 0)
+	if sys.byteorder != 'little':
+		node_first.byteswap()
+		edge_targets.byteswap()
+	sections = [struct.pack('<4I', MAGIC, len(nodes), len(edge_labels), \
+		len(alphabet)), alphabet, node_first.tostring(), \
+		node_final.tostring(), edge_labels.tostring(), edge_targets.tostring()]
+	return ''.join(section + '\0' * (padded(len(section)) - len(section)) \
+		for section in sections)
+
+class Dawg:
+	"""
+	Read-only view of a compiled automaton, over a string or an mmap
+	"""
+	root = 0
+
+	def __init__(self, data):
+		"""
+		data			buffer returned by compile_dawg, or an mmap of it
+		"""
+		magic, num_nodes, num_edges, alphabet_len = \
+			struct.unpack_from('<4I', data, 0)
+		if magic != MAGIC:
+			raise ValueError('Not a compiled DAWG')
+		self.data = data
+		self.num_nodes = num_nodes
+		self.num_edges = num_edges
+		offset = 16
+		self.alphabet = data[offset:offset + alphabet_len]
+		self.codes = {letter: chr(code) for code, letter \
+			in enumerate(self.alphabet)}
+		offset += padded(alphabet_len)
+		self.first_offset = offset
+		offset += 4 * (num_nodes + 1)
+		self.final_offset = offset
+		offset += padded(num_nodes)
+		self.labels_offset = offset
+		offset += padded(num_edges)
+		self.targets_offset = offset
+
+	def code_table(self):
+		""" Returns a str.translate table mapping each letter of the alphabet
+		to its label code, and every other byte to a code no edge carries
+		"""
+		missing = chr(len(self.alphabet)) if len(self.alphabet) < 256 else ''
+		return ''.join(self.codes.get(chr(byte), missing) \
+			for byte in range(256))
+
+	def edge_range(self, node):
+		""" Returns the indices of the first and past-the-last edges of node
+		"""
+		return struct.unpack_from('<2I', self.data, self.first_offset + \
+			4 * node)
+
+	def child(self, node, letter):
+		""" Returns the node reached from [node] by [letter], or None
+		"""
+		code = self.codes.get(letter)
+		if code is None:
+			return None
+		return self.child_code(node, code)
+
+	def child_code(self, node, code):
+		""" Same as child, for the label code (one byte, see self.codes) of
+		a letter
+		"""
+		first, last = self.edge_range(node)
+		edge = self.data.find(code, self.labels_offset + first, \
+			self.labels_offset + last)
+		if edge < 0:
+			return None
+		return struct.unpack_from('<I', self.data, self.targets_offset + \
+			4 * (edge - self.labels_offset))[0]
+
+	def children(self, node):
+		""" Lists the (letter, child) pairs of [node], sorted by letter
+		"""
+		first, last = self.edge_range(node)
+		labels = self.data[self.labels_offset + first:self.labels_offset + last]
+		targets = struct.unpack_from('<{0}I'.format(last - first), self.data, \
+			self.targets_offset + 4 * first)
+		return [(self.alphabet[ord(label)], target) for label, target \
+			in zip(labels, targets)]
+
+	def is_final(self, node):
+		""" Checks whether a word ends at [node]
+		"""
+		return self.data[self.final_offset + node] != '\0'
+
+	def walk(self, word, node=0):
+		""" Follows [word] from [node]; returns the node reached, or None
+		"""
+		for letter in word:
+			node = self.child(node, letter)
+			if node is None:
+				return None
+		return node
+
+	def __contains__(self, word):
+		node = self.walk(word)
+		return node is not None and self.is_final(node)
+
+	def save(self, filename):
+		f = open(filename, 'wb')
+		f.write(self.data[:])
+		f.close()
+
+def build_dawg(words):
+	""" Builds the automaton of [words] in memory
+	"""
+	return Dawg(compile_dawg(words))
+
+def load_dawg(filename):
+	""" Memory-maps a saved automaton, read-only
+	"""
+	f = open(filename, 'rb')
+	data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	f.close()
+	return Dawg(data)
+
+def read_words(filename):
+	""" Reads a whitespace-separated word list, lowercased
+	"""
+	f = open(filename, 'r')
+	words = [word.lower() for word in f.read().split()]
+	f.close()
+	return words
+
+def cached_dawg(filename, cache_dir):
+	""" Returns the automaton of the word list in [filename], memory-mapped
+	from [cache_dir] if it was already compiled there, else compiled and
+	saved there first. The cache file is named after the SHA-1 of the word
+	list and its modification time, so editing the list rebuilds it
+	"""
+	f = open(filename, 'rb')
+	key = hashlib.sha1(f.read())
+	f.close()
+	key.update(repr(os.path.getmtime(filename)))
+	cache_file = os.path.join(cache_dir, key.hexdigest() + '.dawg')
+	if os.path.exists(cache_file):
+		return load_dawg(cache_file)
+	dawg = build_dawg(read_words(filename))
+	if not os.path.isdir(cache_dir):
+		try:
+			os.makedirs(cache_dir)
+		except OSError:
+			if not os.path.isdir(cache_dir):
+				raise
+	# Write to a temporary file and rename it, so concurrent runs never
+	# map a partly written cache file
+	fd, temp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+	os.close(fd)
+	dawg.save(temp_file)
+	os.rename(temp_file, cache_file)
+	return dawg
+
+def main():
+	if len(sys.argv) != 3:
+		print 'Usage: python dawg.py WORD_LIST OUTPUT_FILE'
+		sys.exit(1)
+	words = read_words(sys.argv[1])
+	dawg = build_dawg(words)
+	dawg.save(sys.argv[2])
+	print 'Compiled {0} words into {1} nodes and {2} edges'.format( \
+		len(set(words)), dawg.num_nodes, dawg.num_edges)
+
+if __name__ == '__main__':
+	main()
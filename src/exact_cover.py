@@ -0,0 +1,196 @@
+"""
+Exact cover solver using Knuth's Algorithm X with dancing links. The nodes
+live in flat integer arrays instead of objects, and the search is iterative
+so deep problems (e.g. 25x25 Sudoku) do not hit the recursion limit
+"""
+
+class ExactCover:
+	"""
+	Class to support exact cover problems: choose a set of rows so that every
+	primary column is covered exactly once and every secondary column at
+	most once
+	"""
+	def __init__(self, num_primary, num_secondary=0):
+		"""
+		num_primary		number of columns that must be covered exactly once;
+						columns are numbered from 0
+		num_secondary	number of columns that may be covered at most once,
+						numbered after the primary ones
+
+		Node 0 is the root, nodes 1 to num_columns are the column headers,
+		and the nodes of the rows follow. For each node:
+		left, right		neighbors in its row (or in the header list)
+		up, down		neighbors in its column
+		column			header node of its column
+		row_of			index of its row (-1 for the root and headers)
+		size			maps each header node to the number of nodes below
+		"""
+		num_columns = num_primary + num_secondary
+		self.num_columns = num_columns
+		nodes = range(num_columns + 1)
+		self.left = [node - 1 for node in nodes]
+		self.right = [node + 1 for node in nodes]
+		self.left[0] = num_primary
+		self.right[num_primary] = 0
+		# Secondary headers are not in the header list, so they are never
+		# chosen, but covering them still removes conflicting rows
+		for node in range(num_primary + 1, num_columns + 1):
+			self.left[node] = node
+			self.right[node] = node
+		self.up = list(nodes)
+		self.down = list(nodes)
+		self.column = list(nodes)
+		self.row_of = [-1] * (num_columns + 1)
+		self.size = [0] * (num_columns + 1)
+		self.row_names = []
+
+	def add_row(self, columns, name=None):
+		"""
+		columns			nonempty list of distinct column numbers
+		name			returned in the solutions for this row; defaults
+						to the index of the row
+		"""
+		assert (len(columns) > 0)
+		row = len(self.row_names)
+		self.row_names.append(row if name is None else name)
+		first = len(self.left)
+		for i, col in enumerate(columns):
+			node = first + i
+			header = col + 1
+			self.left.append(first + (i - 1) % len(columns))
+			self.right.append(first + (i + 1) % len(columns))
+			self.up.append(self.up[header])
+			self.down.append(header)
+			self.down[self.up[header]] = node
+			self.up[header] = node
+			self.column.append(header)
+			self.row_of.append(row)
+			self.size[header] += 1
+
+	def cover(self, header):
+		""" Removes a column and every row intersecting it
+		"""
+		left, right, up, down = self.left, self.right, self.up, self.down
+		right[left[header]] = right[header]
+		left[right[header]] = left[header]
+		i = down[header]
+		while i != header:
+			j = right[i]
+			while j != i:
+				down[up[j]] = down[j]
+				up[down[j]] = up[j]
+				self.size[self.column[j]] -= 1
+				j = right[j]
+			i = down[i]
+
+	def uncover(self, header):
+		""" Undoes cover(header), relinking in the reverse order
+		"""
+		left, right, up, down = self.left, self.right, self.up, self.down
+		i = up[header]
+		while i != header:
+			j = left[i]
+			while j != i:
+				self.size[self.column[j]] += 1
+				down[up[j]] = j
+				up[down[j]] = j
+				j = left[j]
+			i = up[i]
+		right[left[header]] = header
+		left[right[header]] = header
+
+	def choose_column(self):
+		""" Returns the primary column header with the fewest rows left
+		"""
+		best = self.right[0]
+		header = self.right[best]
+		while header != 0:
+			if self.size[header] < self.size[best]:
+				best = header
+			header = self.right[header]
+		return best
+
+	def search(self):
+		""" Runs Algorithm X, yielding the list of chosen row nodes for each
+		solution; the list is reused, so copy it before keeping it
+		"""
+		column = self.column
+		chosen = []
+		try:
+			for solution in self.search_from(chosen):
+				yield solution
+		finally:
+			# Restore the links if the caller stopped early
+			while len(chosen) > 0:
+				node = chosen.pop()
+				j = self.left[node]
+				while j != node:
+					self.uncover(column[j])
+					j = self.left[j]
+				self.uncover(column[node])
+
+	def search_from(self, chosen):
+		""" Helper function for search, which owns the [chosen] stack
+		"""
+		right, down, column = self.right, self.down, self.column
+		while True:
+			if right[0] == 0:
+				yield chosen
+				node = None
+			else:
+				header = self.choose_column()
+				self.cover(header)
+				node = down[header]
+			# Find the next row to try, backtracking while columns run out
+			while True:
+				if node is not None and node != column[node]:
+					j = right[node]
+					while j != node:
+						self.cover(column[j])
+						j = right[j]
+					chosen.append(node)
+					break
+				if node is not None:
+					self.uncover(node)
+				if len(chosen) == 0:
+					return
+				node = chosen.pop()
+				j = self.left[node]
+				while j != node:
+					self.uncover(column[j])
+					j = self.left[j]
+				node = down[node]
+
+	def iter_solutions(self, max_solutions=None):
+		""" Streams the solutions, each as the list of names of its rows
+		(sorted by row index)
+		max_solutions		if not None, the maximum number of solutions
+		"""
+		if max_solutions is not None and max_solutions <= 0:
+			return
+		num_found = 0
+		solutions = self.search()
+		try:
+			for chosen in solutions:
+				yield [self.row_names[row] for row \
+					in sorted(self.row_of[node] for node in chosen)]
+				num_found += 1
+				if num_found == max_solutions:
+					return
+		finally:
+			solutions.close()
+
+	def count_solutions(self, limit=None):
+		""" Counts the solutions without building them
+		limit			if not None, counting stops at this many solutions
+		"""
+		count = 0
+		if limit is not None and limit <= 0:
+			return count
+		solutions = self.search()
+		for chosen in solutions:
+			count += 1
+			if count == limit:
+				break
+		solutions.close()
+		return count
@@ -9,6 +9,7 @@ from os import path
 from inspect import getsourcefile
 import argparse
 import itertools
+from dawg import build_dawg, cached_dawg
 
 def make_parser():
 	parser = argparse.ArgumentParser(description='Given a word list, ' \
@@ -18,42 +19,122 @@ def make_parser():
 	source_file = path.abspath(getsourcefile(lambda: 0))
 	tool_dir = path.dirname(path.dirname(source_file))
 	google_dict = path.join(tool_dir, 'word_lists', 'google-10000-english.txt')
-	parser.add_argument('-d', '--dict', type=argparse.FileType('r'), \
-		default=google_dict, \
+	wiki_dict = path.join(tool_dir, 'word_lists', 'wiki-100k.txt')
+	parser.add_argument('-d', '--dict', default=google_dict, \
 		help='Word dictionary, consisting of possible words to spell,' \
 		'defaults to the Google 10000 English list')
+	parser.add_argument('-w', '--wiki', dest='dict', action='store_const', \
+		const=wiki_dict, help='Use the Wikipedia 100k word list as the ' \
+		'dictionary')
 	parser.add_argument('-a', '--all_orders', action='store_true', \
 		help='Toggles whether the word list can be permuted ' \
 		'(i.e. whether the word list is not sorted')
+	parser.add_argument('--cache-dir', default=path.join( \
+		path.expanduser('~'), '.cache', 'word_search'), \
+		help='Directory of the compiled dictionaries, reused while the ' \
+		'dictionary file is unchanged')
+	parser.add_argument('--no-cache', action='store_true', \
+		help='Always rebuild the dictionary trie')
 	return parser
 
-def index_words(word_dict, word_list, all_combos):
-	solns = []
-	if all_combos:
-		orders = itertools.permutations(word_list)
-	else:
-		orders = [word_list]
-	for order in orders:
-		for word in word_dict:
-			if len(word) == len(order):
-				is_valid = True
-				for i in range(len(word)):
-					is_valid = is_valid and (word[i] in list(order[i]))
-				if is_valid:
-					solns.append(word)
-					print word
-	return solns
+def index_by_length(word_dict):
+	""" Maps each word length to the distinct words of that length, in
+	dictionary order
+	"""
+	by_length = {}
+	seen = set()
+	for word in word_dict:
+		if word not in seen:
+			seen.add(word)
+			by_length.setdefault(len(word), []).append(word)
+	return by_length
+
+def has_letter_matching(word, letter_sets):
+	""" Checks whether each letter of [word] can come from a different
+	input word (a perfect bipartite matching between the positions of
+	[word] and [letter_sets]), with Kuhn's augmenting paths
+	"""
+	match_of = [None] * len(letter_sets) # position using each input word
+
+	def augment(pos, visited):
+		for j, letters in enumerate(letter_sets):
+			if word[pos] in letters and j not in visited:
+				visited.add(j)
+				if match_of[j] is None or augment(match_of[j], visited):
+					match_of[j] = pos
+					return True
+		return False
+
+	for pos in range(len(word)):
+		if not augment(pos, set()):
+			return False
+	return True
+
+def trie_words(trie, letter_sets):
+	""" Streams, in alphabetical order, the words of [trie] whose ith letter
+	is in letter_sets[i], walking the trie depth first and following only
+	the allowed letters, so dead prefixes are dropped right away
+	"""
+	allowed = [sorted(letters) for letters in letter_sets]
+
+	def walk(node, prefix):
+		depth = len(prefix)
+		if depth == len(allowed):
+			if trie.is_final(node):
+				yield prefix
+			return
+		for letter in allowed[depth]:
+			child = trie.child(node, letter)
+			if child is not None:
+				for word in walk(child, prefix + letter):
+					yield word
+
+	return walk(trie.root, '')
+
+def index_words(word_dict, word_list, all_combos, trie=None):
+	""" Streams the distinct dictionary words whose ith letter is in the
+	ith word of [word_list], or, if [all_combos], in a different word of
+	[word_list] for each letter, in any order
+	trie			optional automaton of [word_dict] (see dawg.py), used for
+					the ordered case; built on demand if not given, so
+					pass a cached one (dawg.cached_dawg) for speed
+	"""
+	letter_sets = [set(word) for word in word_list]
+	if not all_combos:
+		if trie is None:
+			trie = build_dawg(word_dict)
+		for word in trie_words(trie, letter_sets):
+			yield word
+		return
+	all_letters = set(itertools.chain(*word_list))
+	matchings = {} # result of has_letter_matching for each sorted word
+	for word in index_by_length(word_dict).get(len(word_list), []):
+		if not all_letters.issuperset(word):
+			continue
+		key = ''.join(sorted(word))
+		if key not in matchings:
+			matchings[key] = has_letter_matching(word, letter_sets)
+		if matchings[key]:
+			yield word
 
 def main():
 	parser = make_parser()
 	args = parser.parse_args()
-	word_dict = [word.lower() for word in args.dict.read().split()]
-	args.dict.close()
+	trie = None
+	if not args.all_orders and not args.no_cache:
+		trie = cached_dawg(args.dict, args.cache_dir)
+		word_dict = None
+	else:
+		f = open(args.dict, 'r')
+		word_dict = [word.lower() for word in f.read().split()]
+		f.close()
 	if args.infile == sys.stdin:
 		print 'Enter each word on a new line, terminating with CTRL-D'
 	word_list = [word.lower() for word in args.infile.read().split()]
 	args.infile.close()
-	print index_words(word_dict, word_list, args.all_orders)
+	for word in index_words(word_dict, word_list, args.all_orders, trie):
+		print word
+		sys.stdout.flush()
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,131 @@
+"""
+Benchmark of the Sudoku solver on generated n^2 x n^2 puzzles, measuring the
+solve time and peak memory as the box size n grows
+"""
+
+import sys
+import time
+import random
+import resource
+import argparse
+import multiprocessing
+import sudoku_solver
+from csp import BacktrackSearch
+
+def solved_grid(box_size, rng):
+	""" Makes a random solved grid, by shuffling the rows within each band,
+	the columns within each stack, the bands, the stacks and the digits of
+	a patterned grid
+	"""
+	size = box_size * box_size
+	def shuffled_lines():
+		bands = rng.sample(range(box_size), box_size)
+		return [band * box_size + line for band in bands for line \
+			in rng.sample(range(box_size), box_size)]
+	rows = shuffled_lines()
+	cols = shuffled_lines()
+	digits = rng.sample(range(1, size + 1), size)
+	return {(row, col): digits[(box_size * (rows[row] % box_size) + \
+		rows[row] / box_size + cols[col]) % size] for row in range(size) \
+		for col in range(size)}
+
+def make_puzzle(box_size, holes, rng):
+	""" Blanks a random [holes] fraction of the squares of a solved grid
+	"""
+	grid = solved_grid(box_size, rng)
+	squares = sorted(grid)
+	blanks = set(rng.sample(squares, int(round(holes * len(squares)))))
+	return {square: grid[square] for square in squares \
+		if square not in blanks}
+
+def peak_memory_mb():
+	""" Peak resident memory of this process (ru_maxrss is in kilobytes on
+	Linux, but in bytes on OS X)
+	"""
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == 'darwin':
+		peak /= 1024
+	return peak / 1024.0
+
+def run_trial(trial):
+	""" Builds and solves one generated puzzle; meant to run in a fresh
+	process so the memory measurement only covers this puzzle
+	trial		tuple (box_size, holes, seed, options), where options holds
+				engine, all_different, use_bitsets, arc_consistency and
+				max_solutions
+	"""
+	box_size, holes, seed, options = trial
+	given_assignment = make_puzzle(box_size, holes, random.Random(seed))
+	start_memory = peak_memory_mb()
+	start = time.time()
+	if options['engine'] == 'dlx':
+		problem = sudoku_solver.make_sudoku_exact_cover(given_assignment, \
+			box_size)
+		build_time = time.time() - start
+		start = time.time()
+		num_solutions = problem.count_solutions(options['max_solutions'])
+		return {'build': build_time, 'solve': time.time() - start, \
+			'memory': peak_memory_mb() - start_memory, 'backtracks': None, \
+			'solutions': num_solutions}
+	csp = sudoku_solver.make_sudoku_csp(given_assignment, \
+		options['all_different'], box_size)
+	solver = BacktrackSearch(csp, mrv_queue=True, \
+		use_bitsets=options['use_bitsets'], \
+		arc_consistency=options['arc_consistency'])
+	build_time = time.time() - start
+	start = time.time()
+	solver.solve(options['max_solutions'])
+	solve_time = time.time() - start
+	return {'build': build_time, 'solve': solve_time, \
+		'memory': peak_memory_mb() - start_memory, \
+		'backtracks': solver.num_backtracks, \
+		'solutions': len(solver.solutions)}
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) / 2]
+
+def main():
+	parser = argparse.ArgumentParser(description='Measures the Sudoku ' \
+		'solver on generated puzzles of increasing size')
+	parser.add_argument('-s', '--sizes', default='2,3,4', \
+		help='Comma-separated box sizes n, for n^2 x n^2 grids')
+	parser.add_argument('-t', '--trials', type=int, default=3, \
+		help='Number of puzzles per size')
+	parser.add_argument('--holes', type=float, default=0.5, \
+		help='Fraction of the squares left blank')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('-e', '--engine', choices=['csp', 'dlx'], \
+		default='csp', help='Backtracking search or dancing links')
+	parser.add_argument('--pairwise', action='store_true', \
+		help='Use binary != factors instead of all-different constraints')
+	parser.add_argument('--bitsets', action='store_true', \
+		help='Use bitset domains')
+	parser.add_argument('--ac', choices=['ac3', 'ac2001'], default='ac3', \
+		help='Arc consistency algorithm')
+	parser.add_argument('-m', '--max-solutions', type=int, default=1, \
+		help='Stop each search after this many solutions')
+	args = parser.parse_args()
+	options = {'engine': args.engine, 'all_different': not args.pairwise, \
+		'use_bitsets': args.bitsets, 'arc_consistency': args.ac, \
+		'max_solutions': args.max_solutions}
+	print 'n\tgrid\tbuild ms\tsolve ms\tpeak MB\tbacktracks'
+	for box_size in [int(n) for n in args.sizes.split(',')]:
+		trials = [(box_size, args.holes, args.seed + i, options) for i \
+			in range(args.trials)]
+		# A fresh process per puzzle, so each peak memory is its own
+		pool = multiprocessing.Pool(1, maxtasksperchild=1)
+		results = pool.map(run_trial, trials, chunksize=1)
+		pool.close()
+		pool.join()
+		size = box_size * box_size
+		print '{0}\t{1}x{1}\t{2:.1f}\t{3:.1f}\t{4:.1f}\t{5}'.format(box_size, \
+			size, 1000 * median([r['build'] for r in results]), \
+			1000 * median([r['solve'] for r in results]), \
+			max(r['memory'] for r in results), \
+			median([r['backtracks'] for r in results]) if args.engine \
+			== 'csp' else '-')
+		sys.stdout.flush()
+
+if __name__ == '__main__':
+	main()
@@ -3,82 +3,382 @@ Sudoku solver using backtracking search on a constraint satisfaction problem
 """
 
 import sys
+import math
+import time
 import argparse
 import itertools
+import functools
+import multiprocessing
 from csp import CSP, BacktrackSearch
+from exact_cover import ExactCover
 
-def same_row(square1, square2):
-	return (square1[0] == square2[0])
+# Symbols for the values 1, 2, ..., 25, so puzzles up to 25x25 can be written
+# with one character per square
+SYMBOLS = '123456789ABCDEFGHIJKLMNOP'
 
-def same_col(square1, square2):
-	return (square1[1] == square2[1])
+# Characters accepted for a blank square
+BLANKS = '.?0'
 
-def same_3x3(square1, square2):
-	same_three_row = (square1[0] / 3 == square2[0] / 3)
-	same_three_col = (square1[1] / 3 == square2[1] / 3)
-	return (same_three_row and same_three_col)
+def different_values(v1, v2):
+	return (v1 != v2)
 
-def make_sudoku_csp(given_assignment):
-	""" Creates the CSP with Sudoku restrictions
-	given_assignment	the original puzzle, maps coordinates (r, c) to digits
+def check_regions(regions, box_size):
+	""" Raises ValueError unless [regions] (see sudoku_units) labels a grid
+	with box_size ** 2 rows, split into box_size ** 2 regions of
+	box_size ** 2 squares
+	"""
+	size = box_size * box_size
+	if len(regions) != size or any(len(row) != size for row in regions):
+		raise ValueError('The regions must be a {0}x{0} grid'.format(size))
+	labels = ''.join(regions)
+	if len(set(labels)) != size or \
+		any(labels.count(label) != size for label in set(labels)):
+		raise ValueError('The regions must be {0} regions of {0} ' \
+			'squares each'.format(size))
+
+def sudoku_units(box_size=3, diagonal=False, regions=None):
+	""" Lists the rows, columns and boxes, each as a list of squares
+	box_size		side of a box; the grid has box_size ** 2 rows
+	diagonal		if True, the two main diagonals are units as well
+	regions			optional list of strings, one character per square, 
+					labeling the jigsaw region of each square; the regions
+					replace the boxes
+	"""
+	size = box_size * box_size
+	rows = [[(row, col) for col in range(size)] for row in range(size)]
+	cols = [[(row, col) for row in range(size)] for col in range(size)]
+	if regions is None:
+		boxes = [[(row, col) for row in range(size) for col in range(size) \
+			if row / box_size == box / box_size and \
+			col / box_size == box % box_size] for box in range(size)]
+	else:
+		check_regions(regions, box_size)
+		labels = sorted(set(''.join(regions)))
+		boxes = [[(row, col) for row in range(size) for col in range(size) \
+			if regions[row][col] == label] for label in labels]
+	units = rows + cols + boxes
+	if diagonal:
+		units.append([(i, i) for i in range(size)])
+		units.append([(i, size - 1 - i) for i in range(size)])
+	return units
+
+def make_sudoku_template(all_different, box_size=3, diagonal=False, \
+	regions=None):
+	""" Creates the CSP with the Sudoku restrictions but no given digits
+	all_different		if True, each unit is one all-different constraint; 
+						otherwise every pair of squares sharing a unit gets
+						a binary != factor
+	box_size, diagonal, regions		see sudoku_units
 	"""
+	size = box_size * box_size
 	csp = CSP()
-	for row in range(9):
-		for col in range(9):
-			csp.add_variable((row, col), range(1, 10))
-	for square in given_assignment:
-		csp.add_unary_factor(square, lambda s: (s == given_assignment[square]))
-	for s1 in itertools.product(range(9), range(9)):
-		for s2 in itertools.product(range(9), range(9)):
-			if s1 == s2:
-				continue
-			if same_row(s1, s2) or same_col(s1, s2) or same_3x3(s1, s2):
-				csp.add_binary_factor(s1, s2, lambda v1, v2: (v1 != v2))
+	for row in range(size):
+		for col in range(size):
+			csp.add_variable((row, col), range(1, size + 1))
+	units = sudoku_units(box_size, diagonal, regions)
+	if all_different:
+		for unit in units:
+			csp.add_all_different(unit)
+		return csp
+	related = set()
+	for unit in units:
+		related.update(itertools.combinations(sorted(unit), 2))
+	for s1, s2 in sorted(related):
+		csp.add_binary_factor(s1, s2, different_values)
 	return csp
 
+def add_killer_cages(csp, cages, all_different=True):
+	""" Adds the restrictions of killer Sudoku cages: the squares of a cage
+	hold different digits adding up to the cage total
+	cages			list of pairs (total, list of squares)
+	all_different	whether to use an all-different constraint (or binary 
+					!= factors) within each cage
+	"""
+	for total, squares in cages:
+		if all_different:
+			csp.add_all_different(squares)
+		else:
+			for s1, s2 in itertools.combinations(squares, 2):
+				csp.add_binary_factor(s1, s2, different_values)
+		csp.add_sum_constraint(squares, total)
+
+# Templates built so far, keyed by (all_different, box_size, diagonal, 
+# regions); never modified
+sudoku_templates = {}
+
+def make_sudoku_csp(given_assignment, all_different=True, box_size=3, \
+	diagonal=False, regions=None, cages=None):
+	""" Creates the CSP with Sudoku restrictions, as a copy of the cached 
+	template with a unary factor for each given digit
+	given_assignment	the original puzzle, maps coordinates (r, c) to digits
+	all_different		if True, each unit is one all-different constraint; 
+						otherwise every pair of squares sharing a unit gets
+						a binary != factor
+	box_size, diagonal, regions		see sudoku_units
+	cages				optional killer cages (see add_killer_cages)
+	"""
+	key = (all_different, box_size, diagonal, \
+		None if regions is None else tuple(regions))
+	if key not in sudoku_templates:
+		sudoku_templates[key] = make_sudoku_template(all_different, \
+			box_size, diagonal, regions)
+	csp = sudoku_templates[key].copy()
+	for square, digit in given_assignment.items():
+		csp.add_unary_factor(square, lambda s, digit=digit: (s == digit))
+	if cages:
+		add_killer_cages(csp, cages, all_different)
+	return csp
+
+def make_sudoku_exact_cover(given_assignment, box_size=3, diagonal=False, \
+	regions=None):
+	""" Reduces the Sudoku to an exact cover problem: one row per (square, 
+	digit) choice, named by that pair, covering the column of the square and
+	the (unit, digit) column of every unit containing the square. Squares 
+	with a given digit only get the row of that digit
+	given_assignment	the original puzzle, maps coordinates (r, c) to digits
+	box_size, diagonal, regions		see sudoku_units
+	"""
+	size = box_size * box_size
+	units = sudoku_units(box_size, diagonal, regions)
+	square_units = {}
+	for i, unit in enumerate(units):
+		for square in unit:
+			square_units.setdefault(square, []).append(i)
+	problem = ExactCover(size * size + len(units) * size)
+	for row in range(size):
+		for col in range(size):
+			square = (row, col)
+			if square in given_assignment:
+				digits = [given_assignment[square]]
+			else:
+				digits = range(1, size + 1)
+			for digit in digits:
+				columns = [row * size + col] + [size * size + unit * size + \
+					digit - 1 for unit in square_units[square]]
+				problem.add_row(columns, (square, digit))
+	return problem
+
+def iter_sudoku_solutions(given_assignment, engine='csp', max_solutions=None, \
+	box_size=3, diagonal=False, regions=None, cages=None):
+	""" Streams the solutions of the Sudoku, each as a map of the squares to
+	digits
+	engine				'csp' for BacktrackSearch, or 'dlx' for the exact 
+						cover solver (which does not support cages)
+	max_solutions		if not None, the maximum number of solutions
+	other arguments		see make_sudoku_csp
+	"""
+	if engine == 'dlx':
+		assert (not cages)
+		problem = make_sudoku_exact_cover(given_assignment, box_size, \
+			diagonal, regions)
+		for rows in problem.iter_solutions(max_solutions):
+			yield dict(rows)
+		return
+	csp = make_sudoku_csp(given_assignment, box_size=box_size, \
+		diagonal=diagonal, regions=regions, cages=cages)
+	solver = BacktrackSearch(csp, mrv_queue=True)
+	for solution in solver.iter_solutions(max_solutions):
+		yield solution
+
+def box_size_of(num_squares):
+	""" Returns n such that a grid of [num_squares] squares is n^2 x n^2,
+	or None if there is none
+	"""
+	box_size = int(round(num_squares ** 0.25))
+	if box_size < 1 or box_size ** 4 != num_squares or \
+		box_size ** 2 > len(SYMBOLS):
+		return None
+	return box_size
+
+def parse_grid(raw_puzzle):
+	""" Reads a puzzle written one row per string, one symbol per square
+	raw_puzzle		list of strings; blanks are '?', '.' or '0'
+	Returns the pair (box_size, given_assignment)
+	"""
+	rows = [row for row in raw_puzzle if len(row) > 0]
+	box_size = box_size_of(len(''.join(rows)))
+	if box_size is None or any(len(row) != len(rows) for row in rows):
+		raise ValueError('The puzzle must be a square grid with n^4 squares')
+	size = box_size * box_size
+	given_assignment = {}
+	for row in range(size):
+		for col in range(size):
+			symbol = rows[row][col].upper()
+			if symbol in BLANKS:
+				continue
+			if symbol not in SYMBOLS[:size]:
+				raise ValueError('Unexpected symbol ' + symbol)
+			given_assignment[(row, col)] = SYMBOLS.index(symbol) + 1
+	return box_size, given_assignment
+
 def print_no_newline(s):
 	sys.stdout.write(str(s))
 
-def output_sudoku(assignment):
+def output_sudoku(assignment, box_size=3):
 	""" Formats the Sudoku solution
 	assignment		the solution, maps coordinates (r, c) to digits
+	box_size		side of a box
 	"""
-	assert (len(assignment.keys()) == 81)
-	for row in range(9):
-		for col in range(9):
-			print_no_newline(assignment[(row, col)]) 
-			if col % 3 == 2:
+	size = box_size * box_size
+	assert (len(assignment.keys()) == size * size)
+	for row in range(size):
+		for col in range(size):
+			print_no_newline(SYMBOLS[assignment[(row, col)] - 1]) 
+			if col % box_size == box_size - 1:
 				print_no_newline(' ')
 		print ''
-		if row % 3 == 2:
+		if row % box_size == box_size - 1:
 			print ''
 	print ''
 
-def solve_sudoku(raw_puzzle, output_all):
+def print_solution_count(num_solutions):
+	if num_solutions == 1:
+		print 'There is 1 solution.'
+	else:
+		print 'There are {0} solutions.'.format(num_solutions)
+
+def solve_sudoku(raw_puzzle, output_all, jobs=1, diagonal=False, \
+	regions=None, cages=None, engine='csp', count_only=False):
 	""" Makes and executes the backtracking Sudoku solver, outputs the results
 	raw_puzzle			list of strings, representing the rows of the puzzle
 						'?' represents a blank square
 	output_all			boolean representing whether to print all solutions
-						(if False, we only print the first solution)
-	"""
-	partial_assignment = { (row, col): int(raw_puzzle[row][col]) for row \
-		in range(9) for col in range(9) if raw_puzzle[row][col] != '?' }
-	csp = make_sudoku_csp(partial_assignment)
-	solver = BacktrackSearch(csp)
-	solver.solve()
-	solutions = solver.get_solutions()
-	if len(solutions) == 1:
-		print 'There is 1 solution.'
+						(if False, the search stops once a second solution 
+						proves the puzzle is not unique, and we only print 
+						the first solution)
+	jobs				number of worker processes searching in parallel
+						(only for the csp engine, without count_only)
+	diagonal, regions, cages	variant rules (see make_sudoku_csp)
+	engine				'csp' or 'dlx' (see iter_sudoku_solutions)
+	count_only			if True, only count the solutions
+	"""
+	box_size, partial_assignment = parse_grid(raw_puzzle)
+	max_solutions = None if output_all or count_only else 2
+	if count_only and engine == 'dlx':
+		problem = make_sudoku_exact_cover(partial_assignment, box_size, \
+			diagonal, regions)
+		print_solution_count(problem.count_solutions())
+		return
+	if count_only:
+		solutions = iter_sudoku_solutions(partial_assignment, engine, \
+			max_solutions, box_size, diagonal, regions, cages)
+		print_solution_count(sum(1 for s in solutions))
+		return
+	if engine == 'csp' and jobs > 1:
+		csp = make_sudoku_csp(partial_assignment, box_size=box_size, \
+			diagonal=diagonal, regions=regions, cages=cages)
+		solver = BacktrackSearch(csp, mrv_queue=True)
+		solver.solve_parallel(jobs, max_solutions)
+		solutions = solver.get_solutions()
 	else:
-		print 'There are {0} solutions.'.format(len(solutions))
+		solutions = sorted(iter_sudoku_solutions(partial_assignment, engine, \
+			max_solutions, box_size, diagonal, regions, cages))
+	if output_all or len(solutions) < 2:
+		print_solution_count(len(solutions))
+	else:
+		print 'There are multiple solutions.'
 	if len(solutions) > 0:
 		print 'The first solution is: '
-		output_sudoku(solutions[0])
+		output_sudoku(solutions[0], box_size)
 		if not output_all or len(solutions) == 1:
 			return
 		print 'The remaining solutions are: '
 		for i in range(1, len(solutions)):
-			output_sudoku(solutions[i])
+			output_sudoku(solutions[i], box_size)
+
+def solve_puzzle_line(line, diagonal=False, regions=None, engine='csp'):
+	""" Solves one puzzle of a batch, stopping at the second solution
+	line			n^4 characters listing the squares row by row, with '.', 
+					'0' or '?' for the blanks
+	diagonal, regions	variant rules (see make_sudoku_csp)
+	engine			'csp' or 'dlx' (see iter_sudoku_solutions)
+	Returns a pair (result, seconds), where result is the solution in the 
+	same one-line format, 'no solution', 'multiple' or 'invalid'
+	"""
+	start = time.time()
+	line = line.strip()
+	box_size = box_size_of(len(line))
+	if box_size is None:
+		return 'invalid', time.time() - start
+	size = box_size * box_size
+	try:
+		box_size, partial_assignment = parse_grid([line[i:i + size] \
+			for i in range(0, len(line), size)])
+		if regions is not None:
+			check_regions(regions, box_size)
+	except ValueError:
+		return 'invalid', time.time() - start
+	solutions = list(iter_sudoku_solutions(partial_assignment, engine, 2, \
+		box_size, diagonal, regions))
+	if len(solutions) == 0:
+		result = 'no solution'
+	elif len(solutions) > 1:
+		result = 'multiple'
+	else:
+		solution = solutions[0]
+		result = ''.join(SYMBOLS[solution[(row, col)] - 1] for row \
+			in range(size) for col in range(size))
+	return result, time.time() - start
+
+def percentile(sorted_values, fraction):
+	""" Nearest-rank percentile of a nonempty sorted list
+	"""
+	rank = int(math.ceil(fraction * len(sorted_values))) - 1
+	return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+def windowed_map(pool, func, items, window_size, chunksize):
+	""" Streams func(item) for each of [items] in order, like pool.imap,
+	but reads only [window_size] items ahead (Pool.imap would queue the
+	whole input before returning the first result)
+	"""
+	items = iter(items)
+	while True:
+		window = list(itertools.islice(items, window_size))
+		if len(window) == 0:
+			return
+		for result in pool.map(func, window, chunksize):
+			yield result
+
+def solve_batch(infile, outfile, jobs, diagonal=False, regions=None, \
+	engine='csp'):
+	""" Solves one puzzle per nonempty line of [infile], writing one result 
+	per line to [outfile] in input order, then reports the throughput and 
+	latency percentiles on stderr
+	infile			file with puzzles in the one-line format
+	outfile			file for the results (see solve_puzzle_line)
+	jobs			number of worker processes
+	diagonal, regions	variant rules shared by all the puzzles
+	engine			'csp' or 'dlx' (see iter_sudoku_solutions)
+	"""
+	solve_line = functools.partial(solve_puzzle_line, diagonal=diagonal, \
+		regions=regions, engine=engine)
+	lines = (line for line in infile if line.strip())
+	start = time.time()
+	if jobs > 1:
+		pool = multiprocessing.Pool(jobs)
+		results = windowed_map(pool, solve_line, lines, 32 * jobs, 8)
+	else:
+		pool = None
+		results = itertools.imap(solve_line, lines)
+	latencies = []
+	try:
+		for result, seconds in results:
+			outfile.write(result + '\n')
+			latencies.append(seconds)
+	finally:
+		if pool is not None:
+			pool.terminate()
+			pool.join()
+	elapsed = time.time() - start
+	if len(latencies) == 0:
+		sys.stderr.write('No puzzles solved\n')
+		return
+	latencies.sort()
+	sys.stderr.write('Solved {0} puzzles in {1:.2f}s ({2:.1f} puzzles/sec)\n' \
+		.format(len(latencies), elapsed, len(latencies) / max(elapsed, 1e-9)))
+	sys.stderr.write('Latency (ms): p50 {0:.1f}, p90 {1:.1f}, p99 {2:.1f}, ' \
+		'max {3:.1f}\n'.format(*[1000 * percentile(latencies, fraction) \
+		for fraction in (0.5, 0.9, 0.99, 1.0)]))
 
 def input_sudoku(infile):
 	""" Takes the Sudoku puzzle from file input
@@ -89,15 +389,104 @@ def input_sudoku(infile):
 	raw_puzzle = [''.join(line.split()) for line in infile]
 	return raw_puzzle
 
+def input_regions(infile):
+	""" Reads jigsaw regions: one row per line, one label per square;
+	raises ValueError if they do not split an n^2 x n^2 grid into n^2
+	regions of n^2 squares
+	"""
+	regions = [''.join(line.split()) for line in infile]
+	regions = [row for row in regions if len(row) > 0]
+	box_size = box_size_of(len(''.join(regions)))
+	if box_size is None:
+		raise ValueError('The regions must label an n^2 x n^2 grid')
+	check_regions(regions, box_size)
+	return regions
+
+def input_cages(infile, size):
+	""" Reads killer cages, one per line, as the total followed by the 
+	squares written row,col (counting from 0), e.g. '10 0,0 0,1 1,0';
+	raises ValueError unless each line is an integer total and distinct
+	squares of a [size] x [size] grid
+	"""
+	cages = []
+	for line in infile:
+		fields = line.split()
+		if len(fields) == 0:
+			continue
+		try:
+			total = int(fields[0])
+			squares = [tuple(int(x) for x in field.split(',')) for field \
+				in fields[1:]]
+		except ValueError:
+			raise ValueError('Cages must be an integer total followed by ' \
+				'row,col squares: ' + line.strip())
+		if len(squares) == 0 or any(len(square) != 2 or not all( \
+			0 <= x < size for x in square) for square in squares):
+			raise ValueError('Cage squares must be row,col pairs from 0 ' \
+				'to {0}: '.format(size - 1) + line.strip())
+		if len(set(squares)) != len(squares):
+			raise ValueError('Cage squares must be distinct: ' + \
+				line.strip())
+		cages.append((total, squares))
+	return cages
+
 def main():
 	parser = argparse.ArgumentParser(description='Sudoku solver based on '\
 		'solving a CSP')
 	parser.add_argument('infile', nargs='?', type=argparse.FileType('r'), \
 		default=sys.stdin, help='Optional input file')
-	parser.add_argument('-a', '--all', action='store_true')
+	parser.add_argument('-a', '--all', action='store_true', \
+		help='Find and print every solution, instead of stopping once ' \
+		'a second solution shows the puzzle is not unique')
+	parser.add_argument('-j', '--jobs', type=int, default=1, \
+		help='Number of worker processes to split the search across ' \
+		'(or to solve the puzzles of a batch); a single puzzle is only ' \
+		'split with the csp engine, and not with --count')
+	parser.add_argument('-b', '--batch', action='store_true', \
+		help='Read one puzzle per line as n^4 characters (blanks as ., 0 ' \
+		'or ?) and print one solution, "no solution" or "multiple" per line')
+	parser.add_argument('--diagonal', action='store_true', \
+		help='The two main diagonals must also hold different digits')
+	parser.add_argument('--regions', type=argparse.FileType('r'), \
+		help='Jigsaw regions replacing the boxes, one row per line and ' \
+		'one region label per square')
+	parser.add_argument('--cages', type=argparse.FileType('r'), \
+		help='Killer cages, one per line as the total followed by ' \
+		'row,col squares')
+	parser.add_argument('-e', '--engine', choices=['csp', 'dlx'], \
+		default='csp', help='Backtracking search on the CSP, or dancing ' \
+		'links on the exact cover reduction (no killer cages)')
+	parser.add_argument('-c', '--count', action='store_true', \
+		help='Only print the number of solutions')
 	args = parser.parse_args()
+	if args.engine == 'dlx' and args.cages:
+		parser.error('--cages is not supported by the dlx engine')
+	try:
+		regions = input_regions(args.regions) if args.regions else None
+	except ValueError as e:
+		parser.error('--regions: ' + str(e))
+	if args.batch:
+		if args.cages:
+			parser.error('--cages applies to a single puzzle, not a batch')
+		solve_batch(args.infile, sys.stdout, args.jobs, args.diagonal, \
+			regions, args.engine)
+		return
+	if args.jobs > 1 and (args.count or args.engine == 'dlx'):
+		parser.error('--jobs only splits the search of the csp engine, ' \
+			'without --count')
 	raw_puzzle = input_sudoku(args.infile)
-	solve_sudoku(raw_puzzle, args.all)
+	if regions is not None and len(regions) != \
+		len([row for row in raw_puzzle if len(row) > 0]):
+		parser.error('--regions must have as many rows as the puzzle')
+	cages = None
+	if args.cages:
+		try:
+			cages = input_cages(args.cages, \
+				len([row for row in raw_puzzle if len(row) > 0]))
+		except ValueError as e:
+			parser.error('--cages: ' + str(e))
+	solve_sudoku(raw_puzzle, args.all, args.jobs, args.diagonal, regions, \
+		cages, args.engine, args.count)
 
 if __name__ == '__main__':
 	main()
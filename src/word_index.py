@@ -0,0 +1,261 @@
+"""
+Pattern index over a word list: answers "which words of length n match
+c?t?s" (or [abc][aeiou]..., one letter set per position) by intersecting
+bitmap postings instead of scanning the list
+
+For each word length n, the distinct words of that length are numbered in
+sorted order, and the posting of (n, position, letter) is a Python integer
+whose bit k is set when word k has [letter] at [position]. A query ANDs,
+position by position, the OR of the postings of its allowed letters
+
+File layout (little-endian):
+	header			magic, number of lengths (uint32s)
+	per length		length, number of words, byte size of the words
+					(uint32s), the words joined by newlines, number of
+					postings (uint32), then for each posting its position
+					(uint8), letter (char), byte size (uint32) and the
+					bitmap as big-endian bytes
+"""
+
+import struct
+import argparse
+from binascii import hexlify, unhexlify
+
+MAGIC = 0x58444957 # 'WIDX'
+WILDCARDS = '?.'
+
+def parse_pattern(pattern):
+	""" Turns a pattern into a list with one entry per position: None for
+	a wildcard ('?' or '.'), else the set of allowed letters, given either
+	as one letter or as a bracketed set such as [aeiou]
+	"""
+	letter_sets = []
+	i = 0
+	while i < len(pattern):
+		if pattern[i] in WILDCARDS:
+			letter_sets.append(None)
+		elif pattern[i] == '[':
+			end = pattern.find(']', i)
+			if end < 0:
+				raise ValueError('Unclosed [ in pattern ' + pattern)
+			letter_sets.append(set(pattern[i + 1:end].lower()))
+			i = end
+		else:
+			letter_sets.append(set(pattern[i].lower()))
+		i += 1
+	return letter_sets
+
+def iter_bits(mask):
+	""" Streams the indices of the set bits of [mask], lowest first
+	"""
+	while mask:
+		low = mask & -mask
+		yield low.bit_length() - 1
+		mask ^= low
+
+def int_to_bytes(n):
+	digits = '%x' % n
+	return unhexlify('0' * (len(digits) % 2) + digits)
+
+def bytes_to_int(data):
+	return int(hexlify(data), 16) if len(data) > 0 else 0
+
+class WordIndex:
+	"""
+	Class to support pattern queries over a fixed word list:
+	words			dictionary mapping each length to the sorted distinct words
+					of that length
+	postings		dictionary mapping (length, position, letter) to the
+					bitmap of the words of that length with that letter there
+	"""
+	def __init__(self, words=None):
+		"""
+		words			optional iterable of words to index
+		"""
+		self.words = {}
+		self.postings = {}
+		if words is not None:
+			by_length = {}
+			for word in set(words):
+				by_length.setdefault(len(word), []).append(word)
+			for length, length_words in by_length.items():
+				self.add_length(length, sorted(length_words))
+
+	def add_length(self, length, length_words):
+		""" Indexes the sorted distinct words of one length
+		"""
+		self.words[length] = length_words
+		positions = [{} for pos in range(length)]
+		for k, word in enumerate(length_words):
+			bit = 1 << k
+			for pos, letter in enumerate(word):
+				positions[pos][letter] = positions[pos].get(letter, 0) | bit
+		for pos, letters in enumerate(positions):
+			for letter, posting in letters.items():
+				self.postings[(length, pos, letter)] = posting
+
+	def match_mask(self, letter_sets):
+		""" Returns the bitmap of the words of length len(letter_sets) whose
+		ith letter is in letter_sets[i] (None allows any letter)
+		"""
+		length = len(letter_sets)
+		if length not in self.words:
+			return 0
+		mask = (1 << len(self.words[length])) - 1
+		for pos, letters in enumerate(letter_sets):
+			if letters is None:
+				continue
+			allowed = 0
+			for letter in letters:
+				allowed |= self.postings.get((length, pos, letter), 0)
+			mask &= allowed
+			if mask == 0:
+				break
+		return mask
+
+	def match(self, letter_sets):
+		""" Lists, in sorted order, the words matching [letter_sets] (see
+		match_mask)
+		"""
+		length_words = self.words.get(len(letter_sets), [])
+		return [length_words[k] for k in iter_bits(self.match_mask( \
+			letter_sets))]
+
+	def query(self, pattern):
+		""" Lists the words matching a pattern such as c?t?s or [abc][aeiou]
+		"""
+		return self.match(parse_pattern(pattern))
+
+	def count(self, pattern):
+		""" Number of words matching a pattern, without listing them
+		"""
+		return bin(self.match_mask(parse_pattern(pattern))).count('1')
+
+	def save(self, filename):
+		f = open(filename, 'wb')
+		f.write(struct.pack('<2I', MAGIC, len(self.words)))
+		for length in sorted(self.words):
+			blob = '\n'.join(self.words[length])
+			f.write(struct.pack('<3I', length, len(self.words[length]), \
+				len(blob)))
+			f.write(blob)
+			keys = sorted(key for key in self.postings if key[0] == length)
+			f.write(struct.pack('<I', len(keys)))
+			for key in keys:
+				(_, pos, letter) = key
+				data = int_to_bytes(self.postings[key])
+				f.write(struct.pack('<BcI', pos, letter, len(data)))
+				f.write(data)
+		f.close()
+
+def load_index(filename):
+	""" Loads an index written by WordIndex.save
+	"""
+	f = open(filename, 'rb')
+	data = f.read()
+	f.close()
+	magic, num_lengths = struct.unpack_from('<2I', data, 0)
+	if magic != MAGIC:
+		raise ValueError('Not a word index')
+	index = WordIndex()
+	offset = 8
+	for i in range(num_lengths):
+		length, num_words, blob_size = struct.unpack_from('<3I', data, offset)
+		offset += 12
+		blob = data[offset:offset + blob_size]
+		offset += blob_size
+		index.words[length] = blob.split('\n') if num_words > 0 else []
+		num_postings = struct.unpack_from('<I', data, offset)[0]
+		offset += 4
+		for j in range(num_postings):
+			pos, letter, size = struct.unpack_from('<BcI', data, offset)
+			offset += 6
+			index.postings[(length, pos, letter)] = bytes_to_int( \
+				data[offset:offset + size])
+			offset += size
+	return index
+
+def add_slot_variables(csp, index, slots):
+	""" Adds one CSP variable per crossword slot, whose domain is the words
+	of [index] matching the slot's pattern
+	slots			dictionary mapping each variable to its pattern, or to
+					its list of letter sets (see WordIndex.match)
+	"""
+	for var, pattern in slots.items():
+		if isinstance(pattern, str):
+			pattern = parse_pattern(pattern)
+		csp.add_variable(var, index.match(pattern))
+
+class Crossing:
+	"""
+	Global constraint (see CSP.add_constraint) requiring two slots to share
+	a letter: position [pos1] of the word of [var1] is position [pos2] of
+	the word of [var2]. It only compares the letters each domain still
+	allows at the crossing, so it costs time linear in the domain sizes,
+	where a binary factor table would hold their product
+	"""
+	def __init__(self, var1, pos1, var2, pos2):
+		self.vars = [var1, var2]
+		self.positions = [pos1, pos2]
+
+	def is_consistent(self, assignment, var, val):
+		""" Checks whether var = val is compatible with [assignment]
+		"""
+		i = self.vars.index(var)
+		other = self.vars[1 - i]
+		if other not in assignment:
+			return True
+		return val[self.positions[i]] == \
+			assignment[other][self.positions[1 - i]]
+
+	def propagate(self, domains):
+		""" Removes the words whose letter at the crossing no word of the
+		other slot has there
+		domains			maps each var to its reduced domain
+		Returns a list of (var, val) pairs to remove, or None if the slots
+		have no letter in common
+		"""
+		letters = [set(word[pos] for word in domains[var]) for var, pos \
+			in zip(self.vars, self.positions)]
+		shared = letters[0] & letters[1]
+		if len(shared) == 0:
+			return None
+		removals = []
+		for var, pos, own_letters in zip(self.vars, self.positions, letters):
+			if len(own_letters) > len(shared):
+				removals.extend((var, word) for word in domains[var] \
+					if word[pos] not in shared)
+		return removals
+
+def add_crossing(csp, var1, pos1, var2, pos2):
+	""" Constrains two slots to share a letter: position [pos1] of the word
+	of [var1] is position [pos2] of the word of [var2]
+	"""
+	csp.add_constraint(Crossing(var1, pos1, var2, pos2))
+
+def make_parser():
+	parser = argparse.ArgumentParser(description='Builds a word pattern ' \
+		'index, or queries one with patterns such as c?t?s or [abc][aeiou]')
+	parser.add_argument('index', help='Index file')
+	parser.add_argument('patterns', nargs='*', help='Patterns to look up')
+	parser.add_argument('-b', '--build', metavar='WORD_LIST', \
+		help='Index this word list and save the index first')
+	return parser
+
+def main():
+	args = make_parser().parse_args()
+	if args.build is not None:
+		f = open(args.build, 'r')
+		words = [word.lower() for word in f.read().split()]
+		f.close()
+		index = WordIndex(words)
+		index.save(args.index)
+		print 'Indexed {0} words into {1} postings'.format(len(set(words)), \
+			len(index.postings))
+	else:
+		index = load_index(args.index)
+	for pattern in args.patterns:
+		print pattern + ':', ' '.join(index.query(pattern))
+
+if __name__ == '__main__':
+	main()
@@ -1,5 +1,16 @@
+import os
 import sys
+import json
+import argparse
 import fileinput
+import itertools
+import multiprocessing
+from dawg import build_dawg, cached_dawg
+from aho_corasick import AhoCorasick
+try:
+    import numpy
+except ImportError:
+    numpy = None
  
 MIN_WORD_LENGTH = 4
 
@@ -20,160 +31,326 @@ DIAGONAL_UR_OK = True # diagonal up-right
 DIAGONAL_DL_OK = True # diagonal down-left
 DIAGONAL_UL_OK = True # diagonal up-left
 
+DIRECTION_NAMES = {
+    (0, 1): 'E', (0, -1): 'W', (1, 0): 'S', (-1, 0): 'N',
+    (1, 1): 'SE', (-1, 1): 'NE', (1, -1): 'SW', (-1, -1): 'NW',
+}
+
 
 
 ################# TRIE FUNCTIONS #################
 
+# The trie is a compiled, minimized automaton (see dawg.py) rather than
+# nested dictionaries, so it can also be saved and memory-mapped
+
 def make_trie(words):
-    root = dict()
-    for word in words:
-        current_dict = root
-        for letter in word:
-            current_dict = current_dict.setdefault(letter, {})
-        current_dict['_end_'] = '_end_'
-    return root
+    return build_dawg(words)
 
 def in_trie(trie, word):
-    current_dict = trie
-    for letter in word:
-        if letter in current_dict:
-            current_dict = current_dict[letter]
-        else:
-            return False
-    else:
-        if '_end_' in current_dict:
-            return True
-        else:
-            return False
+    return word in trie
 
 ########################################################
 
 
 
-def find_horizontal_words(valid_directions, word_arr, wst):
-    final_words = set()
-    for row in range(len(word_arr)):
-        line = word_arr[row]
-        for i in range(len(line)):
-
-            # Backward words
-            if valid_directions[1]:
-                for j in range(i + 1):
-                    word = line[j:i + 1][::-1]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, i)))
-
-            # Forward words
-            if valid_directions[0]:
-                for j in range(i + 1, len(line)):
-                    word = line[i: j + 1]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, i)))
-    return final_words
-
-def find_vertical_words(valid_directions, word_arr, wst):
+def enabled_directions():
+    """ Lists the (row step, column step) of every enabled direction """
+    directions = [
+        ((0, 1), HORIZONTAL_FORWARDS_OK),
+        ((0, -1), HORIZONTAL_BACKWARDS_OK),
+        ((1, 0), VERTICAL_DOWN_OK),
+        ((-1, 0), VERTICAL_UP_OK),
+        ((1, 1), DIAGONAL_DR_OK),
+        ((-1, 1), DIAGONAL_UR_OK),
+        ((1, -1), DIAGONAL_DL_OK),
+        ((-1, -1), DIAGONAL_UL_OK),
+    ]
+    return [step for (step, ok) in directions if ok]
+
+
+def make_grid(word_arr):
+    """ Packs the lines of the word search into one rectangular grid: a
+    NumPy uint8 array when NumPy is installed, else a list of strings.
+    Short lines are padded with spaces, which no word contains """
+    num_cols = max([len(line) for line in word_arr] + [0])
+    rows = [line.ljust(num_cols) for line in word_arr]
+    if numpy is None or num_cols == 0:
+        return rows
+    grid = numpy.frombuffer(''.join(rows), dtype=numpy.uint8)
+    return grid.reshape((len(rows), num_cols))
+
+
+def grid_lines(grid):
+    """ Streams every row, column, diagonal and anti-diagonal of the grid
+    once, as (line, (start row, start col), (row step, col step)) triples.
+    Reading a line backwards covers the opposite direction """
+    if numpy is not None and isinstance(grid, numpy.ndarray):
+        for line in numpy_grid_lines(grid):
+            yield line
+        return
+    num_rows = len(grid)
+    num_cols = len(grid[0]) if num_rows > 0 else 0
+    for row in range(num_rows):
+        yield grid[row], (row, 0), (0, 1)
+    for col in range(num_cols):
+        yield ''.join(line[col] for line in grid), (0, col), (1, 0)
+    for offset in range(1 - num_rows, num_cols):
+        row, col = max(0, -offset), max(0, offset)
+        length = min(num_rows - row, num_cols - col)
+        yield ''.join(grid[row + i][col + i] for i in range(length)), \
+            (row, col), (1, 1)
+    for offset in range(1 - num_rows, num_cols):
+        row, col = max(0, -offset), num_cols - 1 - max(0, offset)
+        length = min(num_rows - row, col + 1)
+        yield ''.join(grid[row + i][col - i] for i in range(length)), \
+            (row, col), (1, -1)
+
+
+def numpy_grid_lines(grid):
+    """ Helper function for grid_lines: every line is a strided view of the
+    grid, copied once into a string, since reading a string one letter at a
+    time is much faster than indexing an array """
+    num_rows, num_cols = grid.shape
+    flipped = grid[:, ::-1]
+    for row in range(num_rows):
+        yield grid[row].tostring(), (row, 0), (0, 1)
+    for col in range(num_cols):
+        yield grid[:, col].tostring(), (0, col), (1, 0)
+    for offset in range(1 - num_rows, num_cols):
+        yield grid.diagonal(offset).tostring(), \
+            (max(0, -offset), max(0, offset)), (1, 1)
+    for offset in range(1 - num_rows, num_cols):
+        yield flipped.diagonal(offset).tostring(), \
+            (max(0, -offset), num_cols - 1 - max(0, offset)), (1, -1)
+
+
+def directed_lines(grid, directions):
+    """ Streams the lines of the grid to read in each of [directions], as
+    (line, (start row, start col), (row step, col step), index step)
+    tuples: an index step of -1 reads the line backwards, in the opposite
+    direction, without copying it """
+    directions = set(directions)
+    for line, (row, col), (d_row, d_col) in grid_lines(grid):
+        if (d_row, d_col) in directions:
+            yield line, (row, col), (d_row, d_col), 1
+        if (-d_row, -d_col) in directions:
+            yield line, (row, col), (d_row, d_col), -1
+
+
+def line_letters(line, first, last):
+    """ The letters of a line of grid_lines from index [first] to index
+    [last], read backwards when last < first """
+    if first <= last:
+        return line[first:last + 1]
+    return line[last:first + 1][::-1]
+
+
+def find_words(directions, word_arr, wst, min_length=MIN_WORD_LENGTH):
+    """ Finds every word of the trie starting at any square and reading in
+    any of [directions], returned as a set of (word, (row, col)) pairs.
+    Each walk steps down the trie one square at a time along a line of the
+    grid and stops as soon as no word starts with the letters read so far """
+    code_table = wst.code_table()
     final_words = set()
-    for row in range(len(word_arr)):
-        rows_below = len(word_arr) - row - 1
-        for col in range(len(word_arr[0])):
-
-            # Vertical Down
-            if valid_directions[0]:
-                word = ''
-                for i in range(rows_below + 1):
-                    word += word_arr[row + i][col]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, col)))
-
-            # Vertical Up
-            if valid_directions[1]:
-                word = ''
-                for i in range(row + 1):
-                    word += word_arr[row - i][col]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, col)))
+    for line, (row, col), (d_row, d_col), step in directed_lines( \
+        make_grid(word_arr), directions):
+        # the DAWG label codes of the letters, translated once per line
+        coded = line.translate(code_table)
+        length = len(line)
+        for start in range(length):
+            node = wst.root
+            end = start
+            while 0 <= end < length:
+                node = wst.child_code(node, coded[end])
+                if node is None:
+                    break
+                if abs(end - start) + 1 >= min_length and \
+                    wst.is_final(node):
+                    final_words.add((line_letters(line, start, end), \
+                        (row + start * d_row, col + start * d_col)))
+                end += step
     return final_words
 
 
-def find_diagonal_words(valid_directions, word_arr, wst):
-    final_words = set()
-    for row in range(len(word_arr)):
-        rows_below = len(word_arr) - row - 1
-        for col in range(len(word_arr[0])):
-            columns_right = len(word_arr[0]) - col - 1
-
-            # Diagonal Down-Right
-            if valid_directions[0]:
-                word = ''
-                for i in range(min(columns_right, rows_below) + 1):
-                    word += word_arr[row + i][col + i]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, col)))
-
-            # Diagonal Down-Left
-            if valid_directions[1]:
-                word = ''
-                for i in range(min(col, rows_below) + 1):
-                    word += word_arr[row + i][col - i]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, col)))
-
-            # Diagonal Up-Left
-            if valid_directions[2]:
-                word = ''
-                for i in range(min(col, row) + 1):
-                    word += word_arr[row - i][col - i]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, col)))
-
-            # Diagonal Up-Right
-            if valid_directions[3]:
-                word = ''
-                for i in range(min(columns_right, row) + 1):
-                    word += word_arr[row - i][col + i]
-                    if len(word) >= MIN_WORD_LENGTH and in_trie(wst, word):
-                        final_words.add((word, (row, col)))
-
-    return final_words
+batch_worker = {}
+
+def init_batch_worker(directions, wst, min_length):
+    """ Runs once in each worker process of find_words_batch """
+    batch_worker['directions'] = directions
+    batch_worker['wst'] = wst
+    batch_worker['min_length'] = min_length
+
+def find_batch_grid(word_arr):
+    return find_words(batch_worker['directions'], word_arr, \
+        batch_worker['wst'], batch_worker['min_length'])
+
+def find_words_batch(directions, grids, wst, jobs=1, \
+    min_length=MIN_WORD_LENGTH):
+    """ Solves many word searches against one shared trie, streaming the
+    set of find_words for each grid in order
+    grids           iterable of grids, each a list of lines
+    jobs            number of worker processes; the trie is handed to each
+                    worker once, not once per grid
+    """
+    if jobs <= 1:
+        for word_arr in grids:
+            yield find_words(directions, word_arr, wst, min_length)
+        return
+    pool = multiprocessing.Pool(jobs, init_batch_worker, (directions, wst, \
+        min_length))
+    grids = iter(grids)
+    try:
+        # a window of grids at a time, since Pool.imap would queue the
+        # whole input before returning the first result
+        while True:
+            window = list(itertools.islice(grids, 64 * jobs))
+            if len(window) == 0:
+                break
+            for found in pool.map(find_batch_grid, window, chunksize=16):
+                yield found
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def find_listed_words(directions, word_arr, word_list):
+    """ Finds the words of a fixed list with an Aho-Corasick automaton over
+    the words and their reverses, streaming each line of the grid through
+    it once. Returns a set of (word, (start row, start col), (end row,
+    end col), (row step, col step)) tuples, for the enabled [directions] """
+    word_list = [word for word in word_list if len(word) > 0]
+    automaton = AhoCorasick(word_list + [word[::-1] for word in word_list])
+    directions = set(directions)
+    found = set()
+    for line, (row, col), (d_row, d_col) in grid_lines( \
+        make_grid(word_arr)):
+        for end, i in automaton.iter_matches(line):
+            begin = end - len(automaton.patterns[i]) + 1
+            if i < len(word_list):
+                first, last, step = begin, end, (d_row, d_col)
+            else:
+                first, last, step = end, begin, (-d_row, -d_col)
+            if step in directions:
+                found.add((word_list[i % len(word_list)], \
+                    (row + first * d_row, col + first * d_col), \
+                    (row + last * d_row, col + last * d_col), step))
+    return found
+
+
+def parse_directions(names):
+    """ Parses a comma-separated list of direction names, e.g. 'E,S,SE' """
+    steps = {name: step for (step, name) in DIRECTION_NAMES.items()}
+    directions = []
+    for name in names.upper().split(','):
+        if name not in steps:
+            raise argparse.ArgumentTypeError('Unknown direction ' + name + \
+                ', expected one of ' + ','.join(sorted(steps)))
+        directions.append(steps[name])
+    return directions
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='Finds the words hidden ' \
+        'in a word search grid')
+    parser.add_argument('infile', nargs='?', default='-', \
+        help='Optional input file with one line of the grid per line')
+    parser.add_argument('-w', '--word-list', type=argparse.FileType('r'), \
+        help='File of the words to look for; by default, every word of ' \
+        'the dictionary is a candidate')
+    parser.add_argument('-d', '--dict', default='/usr/share/dict/words', \
+        help='Word dictionary, defaults to /usr/share/dict/words')
+    parser.add_argument('-D', '--directions', type=parse_directions, \
+        default=enabled_directions(), help='Comma-separated directions ' \
+        'the words may read in, among N,S,E,W,NE,NW,SE,SW; defaults to all')
+    parser.add_argument('-m', '--min-length', type=int, \
+        default=MIN_WORD_LENGTH, help='Shortest dictionary word to report')
+    parser.add_argument('-f', '--format', choices=['table', 'tsv', 'json'], \
+        default='table', help='Output format; tsv and json print nothing ' \
+        'but the results')
+    parser.add_argument('--cache-dir', default=os.path.join( \
+        os.path.expanduser('~'), '.cache', 'word_search'), \
+        help='Directory of the compiled dictionaries, reused while the ' \
+        'dictionary file is unchanged')
+    parser.add_argument('--no-cache', action='store_true', \
+        help='Always rebuild the dictionary trie')
+    return parser
+
+
+def output_words(found, missing, output_format):
+    """ Prints the results of find_words (pairs) or find_listed_words
+    (4-tuples); [missing] lists the words of the word list not found """
+    if output_format == 'json':
+        if len(found) > 0 and len(found[0]) == 2:
+            results = [{'word': word, 'row': row, 'col': col} \
+                for (word, (row, col)) in found]
+        else:
+            results = [{'word': word, 'start': start, 'end': end, \
+                'direction': DIRECTION_NAMES[step]} \
+                for (word, start, end, step) in found]
+        output = {'words': results}
+        if missing is not None:
+            output['missing'] = missing
+        print json.dumps(output)
+    elif output_format == 'tsv':
+        for result in found:
+            if len(result) == 2:
+                (word, (row, col)) = result
+                print '\t'.join(map(str, [word, row, col]))
+            else:
+                (word, start, end, step) = result
+                print '\t'.join(map(str, [word, start[0], start[1], \
+                    end[0], end[1], DIRECTION_NAMES[step]]))
+        if missing is not None and len(missing) > 0:
+            sys.stderr.write('Not found: ' + ' '.join(missing) + '\n')
+    elif missing is not None:
+        print "Word", '\t\t', "Start", '\t\t', "End", '\t\t', "Direction"
+        print "-------------------------------------------------"
+        for (word, start, end, step) in found:
+            print word, '\t\t', start, '\t', end, '\t', DIRECTION_NAMES[step]
+        if len(missing) > 0:
+            print '\n', "Not found:", ' '.join(missing)
+    else:
+        print "Word", '\t\t', "Row", '\t', "Column"
+        print "---------------------------------"
+        for (word, (row, col)) in found:
+            print word, '\t\t', row, '\t', col
 
 
 def main():
-    f = open('/usr/share/dict/words', 'r')
-    word_dict = [word.lower() for word in f.read().split()]
-    f.close()
-    wst = make_trie(word_dict)
-
-    print "Input each line of the word search on a separate line"
-    print "Press ENTER after each line and press CTRL+D at the end"
-
-    ws_list = [''.join(line.lower().split()) for line in fileinput.input()]
-    print '\n', "Processing..."
-
-    valid_horizontal_directions = [HORIZONTAL_FORWARDS_OK, HORIZONTAL_BACKWARDS_OK]
-    horizontal_words = find_horizontal_words(valid_horizontal_directions, ws_list, wst)
-
-    valid_vertical_directions = [VERTICAL_DOWN_OK, VERTICAL_UP_OK]
-    vertical_words = find_vertical_words(valid_vertical_directions, ws_list, wst)
-
-    valid_diagonal_directions = [DIAGONAL_DR_OK, DIAGONAL_DL_OK, DIAGONAL_UL_OK, DIAGONAL_UR_OK]
-    diagonal_words = find_diagonal_words(valid_diagonal_directions, ws_list, wst)
-
-    words = list(horizontal_words) + list(vertical_words) + list(diagonal_words)
-    words = sorted(words)
-
-    print "Processed!"
+    args = make_parser().parse_args()
+    interactive = args.format == 'table'
+
+    if interactive and args.infile == '-' and sys.stdin.isatty():
+        print "Input each line of the word search on a separate line"
+        print "Press ENTER after each line and press CTRL+D at the end"
+
+    ws_list = [''.join(line.lower().split()) for line \
+        in fileinput.input(args.infile)]
+    ws_list = [line for line in ws_list if len(line) > 0]
+    if interactive:
+        print '\n', "Processing..."
+
+    if args.word_list is not None:
+        word_list = [word.lower() for word in args.word_list.read().split()]
+        args.word_list.close()
+        found = sorted(find_listed_words(args.directions, ws_list, word_list))
+        missing = sorted(set(word_list) - set(word for word, _, _, _ \
+            in found))
+    else:
+        if args.no_cache:
+            f = open(args.dict, 'r')
+            wst = make_trie([word.lower() for word in f.read().split()])
+            f.close()
+        else:
+            wst = cached_dawg(args.dict, args.cache_dir)
+        found = sorted(find_words(args.directions, ws_list, wst, \
+            args.min_length))
+        missing = None
 
-    print "Word", '\t\t', "Row", '\t', "Column"
-    print "---------------------------------"
-    for (word, (row, col)) in words:
-        print word, '\t\t', row, '\t', col
+    if interactive:
+        print "Processed!"
+    output_words(found, missing, args.format)
 
 
 if __name__ == '__main__':
     main()
-
-
-
-
-
-